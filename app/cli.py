@@ -0,0 +1,65 @@
+"""Команды обслуживания каталога.
+
+    python app/cli.py import test-dump.json --chunk-size 20000  # в пустой каталог, восстановление после сбоя - в README
+    python app/cli.py rebuild-counters
+    python app/cli.py backfill-documents --batch-size 5000
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from db.db import async_session
+from service import counters, documents, events, importer
+
+
+async def run_import(args):
+    with open(args.path, "rb") as dump:
+        async with async_session() as db:
+            try:
+                stats = await importer.import_catalog(db, importer.AsyncFile(dump), chunk_size=args.chunk_size)
+            except importer.DumpError as e:
+                sys.exit(f"import failed, nothing was written: {e}")
+    print(json.dumps(stats))
+
+
+async def run_rebuild_counters(args):
+    async with async_session() as db:
+        stats = await counters.rebuild(db)
+        await events.publish(db, "catalog")
+        await db.commit()
+    print(json.dumps(stats))
+
+
+async def run_backfill_documents(args):
+    async with async_session() as db:
+        stats = await documents.backfill(db, batch_size=args.batch_size)
+        # document filters match differently now, one event for the whole backfill
+        await events.publish(db, "catalog")
+        await db.commit()
+    print(json.dumps(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="stream a JSON dump into the database")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--chunk-size", type=int, default=None)
+    import_parser.set_defaults(handler=run_import)
+
+    rebuild_parser = commands.add_parser("rebuild-counters", help="recompute facet counter tables from scratch")
+    rebuild_parser.set_defaults(handler=run_rebuild_counters)
+
+    backfill_parser = commands.add_parser(
+        "backfill-documents", help="fill products.document from product_properties for existing products")
+    backfill_parser.add_argument("--batch-size", type=int, default=10000)
+    backfill_parser.set_defaults(handler=run_backfill_documents)
+
+    args = parser.parse_args()
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
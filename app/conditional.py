@@ -0,0 +1,131 @@
+"""Условные GET по версии каталога: ETag, Last-Modified, Cache-Control и 304.
+
+Версия каталога одна на весь каталог (catalog_state), поэтому для списков
+совпадение If-None-Match проверяется до вызова эндпоинта и 304 отдается без
+запросов к товарам и фасетам. Товар может не существовать, поэтому для путей по
+префиксу (/product/{uid}) 304 отдается вместо ответа 200 эндпоинта, 404 остается 404.
+
+Пока чтения идут на primary, версия берется из памяти (шина инвалидации) или
+читается из базы одним запросом. Когда чтения идут на реплику, версия читается
+из той же сессии реплики, что потом получает эндпоинт (pinned_read_session):
+ETag не новее отданных данных, даже если реплика отстает.
+"""
+from email.utils import format_datetime, parsedate_to_datetime
+
+from sqlalchemy.future import select
+
+from db.db import engine, pinned_read_session, read_router, read_session
+from service.cache import catalog_version, make_etag
+from service.events import invalidation_bus
+from tables import models
+
+
+def catalog_state_query():
+    state = models.CatalogState
+    return select(state.version, state.updated_at).where(state.id == 1)
+
+
+async def current_version() -> bool:
+    """Убедиться, что catalog_version актуальна; False, если версии еще нет."""
+    if catalog_version.value is None or not invalidation_bus.connected:
+        async with engine.connect() as conn:
+            row = (await conn.execute(catalog_state_query())).first()
+        if row is None:
+            return False
+        catalog_version.set(row.version, row.updated_at)
+    return True
+
+
+def not_modified(headers: dict, etag: str, updated_at) -> bool:
+    if_none_match = headers.get(b"if-none-match")
+    if if_none_match is not None:
+        # weak comparison, as RFC 9110 requires for If-None-Match
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.decode("latin-1").split(",")}
+        return "*" in tags or etag in tags
+
+    if_modified_since = headers.get(b"if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since.decode("latin-1"))
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and updated_at.replace(microsecond=0) <= since
+    return False
+
+
+class ConditionalGetMiddleware:
+    """ASGI middleware условных GET для путей из rules.
+
+    rules - список (путь, по префиксу, Cache-Control); пустой Cache-Control не
+    выставляется. Валидаторы добавляются только к ответам 200.
+    """
+
+    def __init__(self, app, rules: list):
+        self.app = app
+        self.rules = rules
+
+    def match(self, path: str):
+        """(Cache-Control, по префиксу) правила для path или None."""
+        for rule_path, prefix, cache_control in self.rules:
+            if path == rule_path or (prefix and path.startswith(rule_path)):
+                return cache_control, prefix
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        rule = self.match(scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        if read_router.prefers_primary():
+            if not await current_version():
+                return await self.app(scope, receive, send)
+            # taken before the handler runs, so the data is never older than the tag
+            await self.respond(scope, receive, send, rule, catalog_version.value, catalog_version.updated_at)
+            return
+
+        async with read_session() as db:
+            row = (await db.execute(catalog_state_query())).first()
+            if row is None:
+                return await self.app(scope, receive, send)
+            token = pinned_read_session.set(db)
+            try:
+                await self.respond(scope, receive, send, rule, row.version, row.updated_at)
+            finally:
+                pinned_read_session.reset(token)
+
+    async def respond(self, scope, receive, send, rule: tuple, version: int, updated_at):
+        cache_control, item = rule
+        etag = make_etag(version, updated_at)
+        validators = [
+            (b"etag", etag.encode()),
+            (b"last-modified", format_datetime(updated_at, usegmt=True).encode()),
+        ]
+        if cache_control:
+            validators.append((b"cache-control", cache_control.encode()))
+
+        matched = not_modified(dict(scope["headers"]), etag, updated_at)
+        if matched and not item:
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        replaced = False
+
+        async def send_with_validators(message):
+            nonlocal replaced
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                if matched:
+                    # the item exists: its 200 becomes 304 without the body
+                    replaced = True
+                    message = {"type": "http.response.start", "status": 304, "headers": validators}
+                else:
+                    message = {**message, "headers": [*message.get("headers", []), *validators]}
+            elif message["type"] == "http.response.body" and replaced:
+                if message.get("more_body"):
+                    return
+                message = {"type": "http.response.body", "body": b""}
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
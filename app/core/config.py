@@ -8,6 +8,70 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASS: str
 
+    # пул соединений и asyncpg
+    DB_ECHO: bool = False  # логировать каждый SQL запрос (только для отладки)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30  # сколько ждать свободное соединение, секунды
+    DB_POOL_RECYCLE: int = 1800  # пересоздавать соединения старше, секунды
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # statement_timeout в Postgres, 0 - без ограничения
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500  # на соединение, 0 - не кэшировать
+    # запросы дольше этого порога пишутся в лог catalog.slow_query, 0 - выключено
+    SLOW_QUERY_MS: float = 200
+    # реплики для чтения каталога и товаров: URL SQLAlchemy через запятую, пусто - все через primary
+    DB_REPLICA_URLS: str = ""
+    # реплика с ошибкой соединения не используется столько секунд, чтения идут на другие или на primary
+    DB_REPLICA_RETRY_SECONDS: float = 10
+    # после записи чтения процесса идут на primary столько секунд, чтобы не читать отставшую реплику
+    DB_REPLICA_STICKY_SECONDS: float = 2
+
+    # метрики запросов: Server-Timing, гистограммы на /metrics
+    METRICS_ENABLED: bool = True
+    # для разработки: заголовок X-Query-Count с числом SQL запросов за запрос
+    QUERY_COUNT_HEADER: bool = False
+
+    # 'sql' - фильтрация каталога запросами к базе, 'index' - индекс в памяти
+    CATALOG_BACKEND: str = "sql"
+    # страница каталога: 'projection' - строки с json_agg свойств из базы, 'orm' - объекты Product
+    CATALOG_LISTING: str = "projection"
+    # фильтры по list свойствам и чтение товара из products.document (после cli.py backfill-documents)
+    PRODUCT_DOCUMENTS: bool = False
+    # инвалидация кэшей других воркеров через LISTEN/NOTIFY
+    INVALIDATION_BUS: bool = True
+    INVALIDATION_CHANNEL: str = "catalog_invalidation"
+    # проверка LISTEN соединения и максимальная пауза между переподключениями, секунды
+    INVALIDATION_PING_SECONDS: float = 30
+    INVALIDATION_RECONNECT_MAX: float = 30
+    # условные GET по версии каталога (ETag, Last-Modified, 304) и Cache-Control ответов, пусто - без заголовка
+    CONDITIONAL_GET: bool = True
+    CATALOG_CACHE_CONTROL: str = "public, max-age=0, must-revalidate"
+    PRODUCT_CACHE_CONTROL: str = "public, max-age=0, must-revalidate"
+    # порог pg_trgm по умолчанию для поиска по имени с name_match=similarity
+    NAME_SIMILARITY_THRESHOLD: float = 0.3
+    # сколько товаров загрузчик пишет в одной транзакции
+    IMPORT_CHUNK_SIZE: int = 10000
+    # сколько товаров /catalog/export/ читает курсором и дополняет свойствами за раз
+    EXPORT_BATCH_SIZE: int = 1000
+    # максимальный размер пачки в POST /product/batch/
+    PRODUCT_BATCH_MAX_SIZE: int = 1000
+    # отдавать каталог и товары без повторной валидации по response_model
+    FAST_RESPONSES: bool = True
+    # кэш ответов GET /product/{uid}: размер в записях (0 - выключен) и TTL в секундах
+    PRODUCT_CACHE_SIZE: int = 10000
+    PRODUCT_CACHE_TTL: float = 300
+    # кэш результатов /catalog/filter/: размер в записях (0 - выключен) и TTL в секундах
+    FACET_CACHE_SIZE: int = 5000
+    FACET_CACHE_TTL: float = 600
+    # фильтр по нескольким свойствам: 'intersect' - INTERSECT множеств товаров,
+    # 'having' - проверка остальных условий по товарам самого селективного через
+    # GROUP BY product_uid HAVING, 'auto' - выбор по оценкам из счетчиков фасетов
+    FILTER_PLAN: str = "auto"
+    # как часто планировщик фильтров перечитывает оценки из счетчиков фасетов, секунды
+    PLANNER_STATS_TTL: float = 60
+    # реестр свойств перечитывается из-за неизвестного uid не чаще раза за столько секунд
+    REGISTRY_RELOAD_INTERVAL: float = 1
+
     class Config:
         env_file = ".env"
 
@@ -24,5 +88,9 @@ class Settings(BaseSettings):
 
         return url
 
+    def get_replica_urls(self) -> list:
+        """Ссылки на реплики для чтения."""
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(",") if url.strip()]
+
 
 settings = Settings()
\ No newline at end of file
@@ -1,11 +1,176 @@
+import itertools
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from core.config import settings
 
-engine = create_async_engine(settings.get_database_url(), echo=True)
+logger = logging.getLogger("catalog.db")
+slow_query_logger = logging.getLogger("catalog.slow_query")
+
+
+def engine_options() -> dict:
+    """Параметры пула и соединений asyncpg из настроек."""
+    server_settings = {}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+
+    return {
+        "echo": settings.DB_ECHO,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": {
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        },
+    }
+
+
+def install_slow_query_log(engine, threshold_ms: float):
+    """Писать в лог catalog.slow_query запросы дольше threshold_ms одной JSON строкой."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        if duration_ms >= threshold_ms:
+            slow_query_logger.warning(json.dumps({
+                "event": "slow_query",
+                "duration_ms": round(duration_ms, 3),
+                "rows": cursor.rowcount,
+                "executemany": executemany,
+                "statement": " ".join(statement.split())[:2000],
+            }, ensure_ascii=False))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        # after_cursor_execute is not called for a failed statement
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_engine(url, **engine_options())
+        self.session = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.down_until = 0.0
+        self.failures = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def status(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "failures": self.failures, "pool": pool_status(self.engine)}
+
+
+class ReadRouter:
+    """Сессии только для чтения: по кругу по живым репликам, иначе primary.
+
+    Реплика, к которой не удалось подключиться, исключается на
+    DB_REPLICA_RETRY_SECONDS. После записи в процессе (note_write) чтения
+    DB_REPLICA_STICKY_SECONDS идут на primary: реплика может еще не получить
+    изменения, а кэши уже сброшены и заполнились бы старыми данными.
+    """
+
+    def __init__(self, urls: list):
+        self.replicas = [Replica(url) for url in urls]
+        self._turn = itertools.count()
+        self._primary_until = 0.0
+        self.fallbacks = 0
+
+    def prefers_primary(self) -> bool:
+        """Чтения сейчас идут на primary: реплик нет или не прошло окно после записи."""
+        return not self.replicas or time.monotonic() < self._primary_until
+
+    def note_write(self):
+        if self.replicas:
+            self._primary_until = time.monotonic() + settings.DB_REPLICA_STICKY_SECONDS
+
+    async def checkout(self) -> AsyncSession:
+        """Сессия на живой реплике с уже взятым соединением или сессия primary."""
+        if not self.prefers_primary():
+            start = next(self._turn)
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(start + i) % len(self.replicas)]
+                if not replica.healthy:
+                    continue
+                session = replica.session()
+                try:
+                    await session.connection()
+                except Exception as e:
+                    await session.close()
+                    replica.failures += 1
+                    replica.down_until = time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+                    logger.warning("replica %s is down: %s: %s", replica.name, e.__class__.__name__, e)
+                    continue
+                return session
+            self.fallbacks += 1
+        return async_session()
+
+    def status(self) -> list:
+        return [replica.status() for replica in self.replicas]
+
+
+engine = create_async_engine(settings.get_database_url(), **engine_options())
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+read_router = ReadRouter(settings.get_replica_urls())
+engines = [engine, *(replica.engine for replica in read_router.replicas)]
+if settings.SLOW_QUERY_MS:
+    for db_engine in engines:
+        install_slow_query_log(db_engine, settings.SLOW_QUERY_MS)
 
 async def get_db():
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+@asynccontextmanager
+async def read_session():
+    """Сессия для чтений, которым не нужны только что записанные данные."""
+    session = await read_router.checkout()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+# read session of the current request taken in advance by ConditionalGetMiddleware,
+# so the ETag and the response are read from the same replica
+pinned_read_session: ContextVar[Optional[AsyncSession]] = ContextVar("pinned_read_session", default=None)
+
+
+async def get_read_db():
+    session = pinned_read_session.get()
+    if session is not None:
+        yield session
+        return
+    async with read_session() as session:
+        yield session
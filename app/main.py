@@ -1,17 +1,38 @@
-import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.view.catalog import router as catalog_router
+from app.view.imports import router as imports_router
 from app.view.products import router as products_router
 from app.view.properties import router as properties_router
-from db.db import get_db
-from service import crud
+from conditional import ConditionalGetMiddleware
+from core.config import settings
+from db.db import get_db, async_session, engine, engines, pool_status, read_router
+from metrics import MetricsMiddleware, install_query_metrics, registry
+from service import importer
+from service.cache import facet_cache, product_cache
+from service.events import invalidation_bus
+from service.facet_index import facet_index
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.CATALOG_BACKEND == "index":
+        async with async_session() as db:
+            await facet_index.build(db)
+    if settings.INVALIDATION_BUS:
+        await invalidation_bus.start()
+    yield
+    await invalidation_bus.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,15 +42,76 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.CONDITIONAL_GET:
+    app.add_middleware(ConditionalGetMiddleware, rules=[
+        ("/catalog/", False, settings.CATALOG_CACHE_CONTROL),
+        ("/catalog/filter/", False, settings.CATALOG_CACHE_CONTROL),
+        ("/catalog/search/", False, settings.CATALOG_CACHE_CONTROL),
+        ("/product/", True, settings.PRODUCT_CACHE_CONTROL),
+    ])
+
+if settings.METRICS_ENABLED or settings.QUERY_COUNT_HEADER:
+    app.add_middleware(
+        MetricsMiddleware, routes=lambda: app.routes,
+        observe=settings.METRICS_ENABLED, query_count_header=settings.QUERY_COUNT_HEADER)
+    for db_engine in engines:
+        install_query_metrics(db_engine)
+
 app.include_router(catalog_router, prefix="/catalog", tags=["catalog"])
 app.include_router(products_router, prefix="/product", tags=["products"])
 app.include_router(properties_router, prefix="/properties", tags=["properties"])
+app.include_router(imports_router, prefix="/import", tags=["import"])
 
 @app.post("/load-test-data/")
 async def load_test_data(db: AsyncSession = Depends(get_db)):
     test_data_path = Path(__file__).parent.parent / "test-dump.json"
-    with open(test_data_path) as f:
-        test_data = json.load(f)
-
-    await crud.load_test_data(db, test_data)
+    with open(test_data_path, "rb") as f:
+        await importer.import_catalog(db, importer.AsyncFile(f))
     return {"message": "Test data loaded successfully"}
+
+
+@app.get("/cache/stats/")
+async def cache_stats():
+    return {"product": product_cache.stats(), "facets": facet_cache.stats(), "bus": invalidation_bus.stats()}
+
+
+@app.get("/health/db/")
+async def db_health():
+    """Проверка базы и состояние пула соединений."""
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        status = "ok"
+    except Exception as e:
+        status = f"error: {e.__class__.__name__}"
+    return JSONResponse(
+        {"status": status, "pool": pool_status(engine), "replicas": read_router.status()},
+        status_code=200 if status == "ok" else 503,
+    )
+
+
+def pool_gauges():
+    pool = pool_status(engine)
+    return [
+        ("catalog_db_pool_checked_out", "Connections in use", "gauge", pool["checked_out"]),
+        ("catalog_db_pool_checked_in", "Idle connections in the pool", "gauge", pool["checked_in"]),
+        ("catalog_db_pool_overflow", "Overflow connections (negative while below pool size)", "gauge", pool["overflow"]),
+    ]
+
+
+def cache_gauges():
+    gauges = []
+    for name, cache in (("product", product_cache), ("facets", facet_cache)):
+        stats = cache.stats()
+        gauges.append((f"catalog_{name}_cache_hits_total", f"{name} cache hits", "counter", stats["hits"]))
+        gauges.append((f"catalog_{name}_cache_misses_total", f"{name} cache misses", "counter", stats["misses"]))
+        gauges.append((f"catalog_{name}_cache_size", f"{name} cache entries", "gauge", stats["size"]))
+    return gauges
+
+
+if settings.METRICS_ENABLED:
+    registry.gauges.extend([pool_gauges, cache_gauges])
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,191 @@
+"""Метрики запросов: количество и время SQL, время сериализации, размер ответа.
+
+Значения текущего запроса копятся в RequestMetrics через contextvar, попадают
+в заголовок Server-Timing и в гистограммы, которые отдаются в формате
+Prometheus на /metrics.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestMetrics:
+    __slots__ = ("started", "sql_count", "db_seconds", "serialize_seconds")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_metrics", default=None)
+
+
+def record_serialization(seconds: float):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.serialize_seconds += seconds
+
+
+class Histogram:
+    """Гистограмма Prometheus с фиксированными корзинами по наборам меток."""
+
+    def __init__(self, name: str, help: str, buckets: tuple, label_names: tuple):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}  # labels -> [bucket counts..., above the last bucket, sum, count]
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_text = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        labels = ("method", "route")
+        self.duration = Histogram(
+            "catalog_request_duration_seconds", "Request latency", LATENCY_BUCKETS, labels)
+        self.db_time = Histogram(
+            "catalog_request_db_seconds", "Time spent in SQL statements per request", LATENCY_BUCKETS, labels)
+        self.db_queries = Histogram(
+            "catalog_request_db_queries", "SQL statements per request", QUERY_BUCKETS, labels)
+        self.serialization = Histogram(
+            "catalog_request_serialization_seconds", "Response serialization time", LATENCY_BUCKETS, labels)
+        self.response_size = Histogram(
+            "catalog_response_size_bytes", "Response body size", SIZE_BUCKETS, labels)
+        self.requests = {}  # (method, route, status) -> count
+        self.gauges = []    # callables returning [(name, help, type, value)]
+
+    def observe(self, method: str, route: str, status: int, metrics: RequestMetrics, size: int):
+        labels = (method, route)
+        self.duration.observe(labels, time.perf_counter() - metrics.started)
+        self.db_time.observe(labels, metrics.db_seconds)
+        self.db_queries.observe(labels, metrics.sql_count)
+        self.serialization.observe(labels, metrics.serialize_seconds)
+        self.response_size.observe(labels, size)
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def render(self) -> str:
+        lines = ["# HELP catalog_requests_total Requests by route and status",
+                 "# TYPE catalog_requests_total counter"]
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f'catalog_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+        for histogram in (self.duration, self.db_time, self.db_queries, self.serialization, self.response_size):
+            lines.extend(histogram.render())
+        for collect in self.gauges:
+            for name, help, metric_type, value in collect():
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {metric_type}", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def install_query_metrics(engine):
+    """Считать SQL запросы и их время в RequestMetrics текущего запроса."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_metrics.get() is not None:
+            context.metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics = current_metrics.get()
+        started = getattr(context, "metrics_started", None)
+        if metrics is not None and started is not None:
+            metrics.sql_count += 1
+            metrics.db_seconds += time.perf_counter() - started
+
+
+def server_timing(metrics: RequestMetrics, size: Optional[int]) -> bytes:
+    parts = [
+        f'db;dur={metrics.db_seconds * 1000:.2f};desc="{metrics.sql_count} queries"',
+        f"ser;dur={metrics.serialize_seconds * 1000:.2f}",
+        f"total;dur={(time.perf_counter() - metrics.started) * 1000:.2f}",
+    ]
+    if size is not None:
+        parts.append(f'size;desc="{size} bytes"')
+    return ", ".join(parts).encode()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: Server-Timing в ответе и наблюдения в registry по шаблону маршрута.
+
+    С query_count_header в ответ добавляется X-Query-Count - число SQL запросов.
+    """
+
+    def __init__(self, app, routes=None, observe: bool = True, query_count_header: bool = False):
+        self.app = app
+        self._routes = routes  # callable returning the app routes, read lazily
+        self._templates = None
+        self.observe = observe
+        self.query_count_header = query_count_header
+
+    def route_template(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._templates is None:
+            self._templates = {
+                getattr(route, "endpoint", None): route.path for route in self._routes()
+            }
+        return self._templates.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        state = {"status": 500, "size": 0}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                length = next((int(v) for k, v in headers if k == b"content-length"), None)
+                if self.observe:
+                    headers.append((b"server-timing", server_timing(metrics, length)))
+                if self.query_count_header:
+                    headers.append((b"x-query-count", str(metrics.sql_count).encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_metrics.reset(token)
+            if self.observe:
+                registry.observe(scope["method"], self.route_template(scope), state["status"], metrics, state["size"])
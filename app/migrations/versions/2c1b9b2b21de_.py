@@ -0,0 +1,66 @@
+"""facet counter tables
+
+Revision ID: 2c1b9b2b21de
+Revises: 5429e8652cda
+Create Date: 2026-10-18 13:41:26.208114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c1b9b2b21de'
+down_revision: Union[str, None] = '5429e8652cda'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('facet_value_counts',
+    sa.Column('property_uid', sa.String(), nullable=False),
+    sa.Column('value_uid', sa.String(), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['property_uid'], ['properties.uid'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['value_uid'], ['property_values.uid'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('property_uid', 'value_uid')
+    )
+    op.create_table('facet_int_ranges',
+    sa.Column('property_uid', sa.String(), nullable=False),
+    sa.Column('min_value', sa.Integer(), nullable=True),
+    sa.Column('max_value', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['property_uid'], ['properties.uid'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('property_uid')
+    )
+    op.create_table('catalog_counters',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # same aggregates as `python app/cli.py rebuild-counters`
+    op.execute("""
+        INSERT INTO facet_value_counts (property_uid, value_uid, product_count)
+        SELECT property_uid, value_uid, count(*)
+        FROM product_properties
+        WHERE property_uid IS NOT NULL AND value_uid IS NOT NULL
+        GROUP BY property_uid, value_uid
+    """)
+    op.execute("""
+        INSERT INTO facet_int_ranges (property_uid, min_value, max_value)
+        SELECT property_uid, min(value_int), max(value_int)
+        FROM product_properties
+        WHERE property_uid IS NOT NULL AND value_uid IS NULL
+        GROUP BY property_uid
+    """)
+    op.execute("INSERT INTO catalog_counters (name, value) SELECT 'products', count(*) FROM products")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('catalog_counters')
+    op.drop_table('facet_int_ranges')
+    op.drop_table('facet_value_counts')
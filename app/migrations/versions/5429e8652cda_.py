@@ -0,0 +1,29 @@
+"""products name trigram index
+
+Revision ID: 5429e8652cda
+Revises: d06868f4394e
+Create Date: 2026-10-18 12:20:07.554310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5429e8652cda'
+down_revision: Union[str, None] = 'd06868f4394e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_products_name_trgm', 'products', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_trgm', table_name='products')
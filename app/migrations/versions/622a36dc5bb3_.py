@@ -0,0 +1,33 @@
+"""products.document jsonb
+
+Revision ID: 622a36dc5bb3
+Revises: 2c1b9b2b21de
+Create Date: 2026-10-18 17:36:24.116164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '622a36dc5bb3'
+down_revision: Union[str, None] = '2c1b9b2b21de'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing rows are filled by `python app/cli.py backfill-documents`
+    op.add_column('products', sa.Column('document', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.create_index('ix_products_document', 'products', ['document'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'document': 'jsonb_path_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_document', table_name='products', postgresql_using='gin')
+    op.drop_column('products', 'document')
@@ -0,0 +1,34 @@
+"""catalog_state version for etags
+
+Revision ID: b66b659f579d
+Revises: 622a36dc5bb3
+Create Date: 2026-10-18 17:43:31.674566
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b66b659f579d'
+down_revision: Union[str, None] = '622a36dc5bb3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalog_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO catalog_state (id, version, updated_at) VALUES (1, 1, now())")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('catalog_state')
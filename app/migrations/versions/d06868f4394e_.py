@@ -0,0 +1,65 @@
+"""typed product property values
+
+Revision ID: d06868f4394e
+Revises: f995ca106e78
+Create Date: 2026-10-18 11:03:52.118640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd06868f4394e'
+down_revision: Union[str, None] = 'f995ca106e78'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('property_values',
+    sa.Column('uid', sa.String(), nullable=False),
+    sa.Column('property_uid', sa.String(), nullable=True),
+    sa.Column('value', sa.String(), nullable=True),
+    sa.Column('position', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['property_uid'], ['properties.uid'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('uid')
+    )
+    op.create_index(op.f('ix_property_values_property_uid'), 'property_values', ['property_uid'], unique=False)
+
+    # list values that already carry a uid in properties.values
+    op.execute("""
+        INSERT INTO property_values (uid, property_uid, value, position)
+        SELECT item.value ->> 'uid', p.uid, item.value ->> 'value', item.ordinality
+        FROM properties p,
+             json_array_elements(
+                 CASE WHEN json_typeof(p.values) = 'array' THEN p.values ELSE '[]'::json END
+             ) WITH ORDINALITY AS item
+        WHERE p.type = 'list' AND item.value ->> 'uid' IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+    op.add_column('product_properties', sa.Column('value_uid', sa.String(), nullable=True))
+    op.add_column('product_properties', sa.Column('value_int', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'product_properties_value_uid_fkey', 'product_properties', 'property_values', ['value_uid'], ['uid'])
+    op.create_index(op.f('ix_product_properties_product_uid'), 'product_properties', ['product_uid'], unique=False)
+    op.create_index('ix_product_properties_property_value_uid', 'product_properties',
+                    ['property_uid', 'value_uid', 'product_uid'], unique=False)
+    op.create_index('ix_product_properties_property_value_int', 'product_properties',
+                    ['property_uid', 'value_int', 'product_uid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_properties_property_value_int', table_name='product_properties')
+    op.drop_index('ix_product_properties_property_value_uid', table_name='product_properties')
+    op.drop_index(op.f('ix_product_properties_product_uid'), table_name='product_properties')
+    op.drop_constraint('product_properties_value_uid_fkey', 'product_properties', type_='foreignkey')
+    op.drop_column('product_properties', 'value_int')
+    op.drop_column('product_properties', 'value_uid')
+    op.drop_index(op.f('ix_property_values_property_uid'), table_name='property_values')
+    op.drop_table('property_values')
@@ -0,0 +1,27 @@
+"""products name uid index
+
+Revision ID: f995ca106e78
+Revises: 566843b869a7
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f995ca106e78'
+down_revision: Union[str, None] = '566843b869a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_name_uid', 'products', ['name', 'uid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_uid', table_name='products')
@@ -0,0 +1,67 @@
+import json
+import time
+
+from fastapi.responses import JSONResponse
+
+from core.config import settings
+from metrics import record_serialization
+from service.registry import property_registry
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+def property_uids(product) -> list:
+    """uid свойств товара: модели Product или строки (проекция каталога, документ), где properties - список uid."""
+    return [prop if isinstance(prop, str) else prop.property_uid for prop in product.properties]
+
+
+def product_to_dict(product) -> dict:
+    """Ответ по товару; имя и значения свойств берутся из реестра свойств."""
+    properties = []
+    for prop_uid in property_uids(product):
+        info = property_registry.get(prop_uid)
+        prop_data = {
+            "uid": prop_uid,
+            "name": info.name,
+            "value": info.values,
+        }
+        properties.append(prop_data)
+
+    return {
+        "uid": product.uid,
+        "name": product.name,
+        "properties": properties
+    }
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse без повторной валидации по response_model.
+
+    Вывод совпадает байт в байт с JSONResponse: компактные разделители и
+    UTF-8 без экранирования.
+    """
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        if orjson is not None:
+            body = orjson.dumps(content)
+        else:
+            body = json.dumps(
+                content,
+                ensure_ascii=False,
+                allow_nan=False,
+                indent=None,
+                separators=(",", ":"),
+            ).encode("utf-8")
+        record_serialization(time.perf_counter() - started)
+        return body
+
+
+def respond(content: dict):
+    """Отдать уже собранный ответ напрямую, минуя валидацию FastAPI (FAST_RESPONSES)."""
+    if settings.FAST_RESPONSES:
+        return FastJSONResponse(content)
+    return content
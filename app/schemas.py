@@ -2,6 +2,7 @@ from typing import List, Optional, Union, Any
 from pydantic import BaseModel
 
 class PropertyValue(BaseModel):
+    uid: Optional[str] = None
     value: str
 
 class PropertyCreate(BaseModel):
@@ -15,7 +16,8 @@ class PropertyResponse(PropertyCreate):
 
 class ProductPropertyBase(BaseModel):
     uid: str
-    value: Optional[str] = None
+    value_uid: Optional[str] = None  # for 'list' properties
+    value: Optional[Union[int, str]] = None  # for 'int' properties
 
 class ProductPropertyResponse(BaseModel):
     uid: str
@@ -34,8 +36,24 @@ class ProductResponse(BaseModel):
 
 class ProductListResponse(BaseModel):
     products: List[ProductResponse]
-    count: int
+    count: Optional[int]  # None with count=none
+    next_cursor: Optional[str] = None  # only in cursor mode
+    has_more: Optional[bool] = None  # only with count=none
+
+class ProductBatchError(BaseModel):
+    index: int
+    uid: Optional[str] = None
+    detail: str
+
+class ProductBatchResponse(BaseModel):
+    created: int
+    updated: int
+    errors: List[ProductBatchError]
 
 class FilterResponse(BaseModel):
     count: int
-    properties: dict
\ No newline at end of file
+    properties: dict
+class CatalogSearchResponse(BaseModel):
+    products: List[ProductResponse]
+    count: int
+    properties: dict
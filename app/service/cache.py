@@ -0,0 +1,167 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+from core.config import settings
+
+
+class LRUCache:
+    """Ограниченный LRU кэш с TTL и тегами для точечной инвалидации.
+
+    Тег связывает запись с тем, от чего она зависит (например, uid свойства),
+    invalidate_tag удаляет все такие записи. generation растет при каждой
+    инвалидации: значение, прочитанное из базы до инвалидации, не попадет в кэш,
+    если передать в set полученный заранее generation.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data = OrderedDict()  # key -> (value, expires_at, tags)
+        self._tags = {}             # tag -> set of keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Значение без учета в статистике и без обновления порядка LRU."""
+        entry = self._data.get(key)
+        if entry is None or (entry[1] is not None and entry[1] < time.monotonic()):
+            return default
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), generation: int = None):
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return  # invalidated while the value was being built
+
+        if key in self._data:
+            self._remove(key)
+
+        tags = frozenset(tags)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (value, expires_at, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self.generation += 1
+        if key in self._data:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_tag(self, tag: Hashable):
+        self.generation += 1
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.invalidations += len(self._data)
+        self._data.clear()
+        self._tags.clear()
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class Generation:
+    """Счетчик изменений каталога, растет при каждой записи товаров или свойств.
+
+    Входит в ключ кэшей, зависящих от всего каталога: после bump() старые записи
+    больше не находятся и вытесняются по LRU.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def bump(self):
+        self.value += 1
+
+
+catalog_generation = Generation()
+
+
+class CatalogVersion:
+    """Версия каталога из catalog_state, общая для всех воркеров (в отличие от Generation).
+
+    Из нее строятся ETag и Last-Modified. Процесс узнает новую версию после
+    коммита своей записи и из событий шины инвалидации.
+    """
+
+    def __init__(self):
+        self.value = None
+        self.updated_at = None
+
+    def set(self, value: int, updated_at):
+        self.value, self.updated_at = value, updated_at
+
+    def advance(self, value: int, updated_at):
+        if self.value is None or value > self.value:
+            self.set(value, updated_at)
+
+    @property
+    def etag(self) -> str:
+        return make_etag(self.value, self.updated_at)
+
+
+def make_etag(version: int, updated_at) -> str:
+    # the timestamp keeps tags unique if the counter is ever reset
+    return f'"{version}-{int(updated_at.timestamp() * 1000):x}"'
+
+
+catalog_version = CatalogVersion()
+
+# GET /product/{uid} responses (product_to_dict), tagged by property uid
+product_cache = LRUCache(settings.PRODUCT_CACHE_SIZE, ttl=settings.PRODUCT_CACHE_TTL)
+# /catalog/filter/ results keyed by (catalog generation, filter signature)
+facet_cache = LRUCache(settings.FACET_CACHE_SIZE, ttl=settings.FACET_CACHE_TTL)
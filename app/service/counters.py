@@ -0,0 +1,184 @@
+from collections import Counter
+
+from sqlalchemy import Integer, cast, delete, func, literal, null, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import models
+
+PRODUCTS = "products"
+
+
+async def apply_deltas(db: AsyncSession, added=(), removed=(), products: int = 0):
+    """Обновить счетчики фасетов в текущей транзакции.
+
+    added / removed - строки product_properties (property_uid, value_uid, value_int),
+    products - на сколько изменилось количество товаров. Вызывать после того, как
+    строки product_properties уже записаны или удалены: min/max int свойств,
+    из которых удалялись значения, пересчитываются по таблице.
+    """
+    value_deltas = Counter()
+    added_ranges = {}
+    shrunk = set()
+
+    for property_uid, value_uid, value_int in added:
+        if value_uid is not None:
+            value_deltas[(property_uid, value_uid)] += 1
+        elif value_int is not None:
+            low, high = added_ranges.get(property_uid, (value_int, value_int))
+            added_ranges[property_uid] = (min(low, value_int), max(high, value_int))
+        else:
+            added_ranges.setdefault(property_uid, (None, None))
+
+    for property_uid, value_uid, value_int in removed:
+        if value_uid is not None:
+            value_deltas[(property_uid, value_uid)] -= 1
+        else:
+            shrunk.add(property_uid)
+
+    # sorted keys keep the lock order stable between concurrent writers
+    value_rows = [
+        {"property_uid": property_uid, "value_uid": value_uid, "product_count": delta}
+        for (property_uid, value_uid), delta in sorted(value_deltas.items()) if delta
+    ]
+    if value_rows:
+        stmt = insert(models.FacetValueCount).values(value_rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.FacetValueCount.property_uid, models.FacetValueCount.value_uid],
+            set_={"product_count": models.FacetValueCount.product_count + stmt.excluded.product_count},
+        ))
+
+    if added_ranges:
+        stmt = insert(models.FacetIntRange).values([
+            {"property_uid": property_uid, "min_value": low, "max_value": high}
+            for property_uid, (low, high) in sorted(added_ranges.items())
+        ])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.FacetIntRange.property_uid],
+            set_={
+                "min_value": func.least(models.FacetIntRange.min_value, stmt.excluded.min_value),
+                "max_value": func.greatest(models.FacetIntRange.max_value, stmt.excluded.max_value),
+            },
+        ))
+
+    if shrunk:
+        await db.execute(build_range_update(sorted(shrunk)))
+
+    if products:
+        stmt = insert(models.CatalogCounter).values(name=PRODUCTS, value=products)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.CatalogCounter.name],
+            set_={"value": models.CatalogCounter.value + stmt.excluded.value},
+        ))
+
+
+def build_range_update(property_uids: list):
+    """Пересчитать min/max int свойств по product_properties.
+
+    Условие value_int IS NOT NULL целиком входит в индекс (property_uid, value_int),
+    поэтому min и max - по одной записи с краев индекса, O(log n) на свойство.
+    """
+    pp = models.ProductProperty
+    values = select(pp.value_int).where(
+        pp.property_uid == models.FacetIntRange.property_uid, pp.value_int.is_not(None))
+    return (
+        update(models.FacetIntRange)
+        .where(models.FacetIntRange.property_uid.in_(property_uids))
+        .values(
+            min_value=values.with_only_columns(func.min(pp.value_int)).scalar_subquery(),
+            max_value=values.with_only_columns(func.max(pp.value_int)).scalar_subquery(),
+        )
+    )
+
+
+def build_counters_query():
+    """Фасеты всего каталога из таблиц счетчиков в том же виде, что и facets.build_facet_query."""
+    total_query = select(
+        null().label("property_uid"),
+        null().label("value_uid"),
+        models.CatalogCounter.value.label("count"),
+        cast(null(), Integer).label("min_value"),
+        cast(null(), Integer).label("max_value"),
+    ).where(models.CatalogCounter.name == PRODUCTS)
+
+    values_query = select(
+        models.FacetValueCount.property_uid,
+        models.FacetValueCount.value_uid,
+        models.FacetValueCount.product_count,
+        cast(null(), Integer),
+        cast(null(), Integer),
+    )
+
+    ranges_query = select(
+        models.FacetIntRange.property_uid,
+        null(),
+        null(),
+        models.FacetIntRange.min_value,
+        models.FacetIntRange.max_value,
+    )
+
+    return union_all(total_query, values_query, ranges_query)
+
+
+def parse_facet_rows(facet_rows) -> tuple:
+    """Разобрать строки (property_uid, value_uid, count, min_value, max_value) в (count, value_counts, ranges).
+
+    Формат общий для facets.build_facet_query и build_counters_query.
+    """
+    count = 0
+    value_counts = {}
+    ranges = {}
+    for row in facet_rows:
+        if row.property_uid is None:
+            count = row.count
+        elif row.value_uid is None:
+            ranges[row.property_uid] = (row.min_value, row.max_value)
+        else:
+            value_counts[(row.property_uid, row.value_uid)] = row.count
+    return count, value_counts, ranges
+
+
+async def read_facets(db: AsyncSession):
+    """(count, value_counts, ranges) по всему каталогу одним запросом к счетчикам."""
+    return parse_facet_rows((await db.execute(build_counters_query())).all())
+
+
+async def rebuild(db: AsyncSession) -> dict:
+    """Пересчитать счетчики с нуля по products и product_properties.
+
+    Коммит за вызывающим: вместе с ним должно уйти событие catalog (events.publish),
+    иначе воркеры и клиенты с ETag продолжат отдавать старые счетчики.
+    """
+    # writers wait until the rebuild commits and apply their deltas on top of it
+    await db.execute(text(
+        "LOCK TABLE facet_value_counts, facet_int_ranges, catalog_counters IN EXCLUSIVE MODE"))
+
+    for model in (models.FacetValueCount, models.FacetIntRange, models.CatalogCounter):
+        await db.execute(delete(model))
+
+    pp = models.ProductProperty
+    await db.execute(insert(models.FacetValueCount).from_select(
+        ["property_uid", "value_uid", "product_count"],
+        select(pp.property_uid, pp.value_uid, func.count())
+        .where(pp.property_uid.is_not(None), pp.value_uid.is_not(None))
+        .group_by(pp.property_uid, pp.value_uid)
+    ))
+    await db.execute(insert(models.FacetIntRange).from_select(
+        ["property_uid", "min_value", "max_value"],
+        select(pp.property_uid, func.min(pp.value_int), func.max(pp.value_int))
+        .where(pp.property_uid.is_not(None), pp.value_uid.is_(None))
+        .group_by(pp.property_uid)
+    ))
+    await db.execute(insert(models.CatalogCounter).from_select(
+        ["name", "value"],
+        select(literal(PRODUCTS), func.count()).select_from(models.Product)
+    ))
+
+    stats = {
+        "values": (await db.execute(select(func.count()).select_from(models.FacetValueCount))).scalar(),
+        "int_properties": (await db.execute(select(func.count()).select_from(models.FacetIntRange))).scalar(),
+        "products": (await db.execute(
+            select(models.CatalogCounter.value).where(models.CatalogCounter.name == PRODUCTS))).scalar(),
+    }
+    return stats
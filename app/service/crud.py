@@ -1,27 +1,60 @@
-from sqlalchemy import func, and_, or_
+import json
+import uuid
+from typing import Optional
+
+from sqlalchemy import func, and_, tuple_, any_, bindparam, cast, delete, literal_column, true, String, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, aggregate_order_by, insert as pg_insert
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from core.config import settings
+from responses import property_uids
+from service import counters, documents, events, facets
+from service.cache import catalog_generation, facet_cache, product_cache
+from service.facet_index import facet_index
+from service.filters import apply_product_filters, filter_signature, set_similarity_threshold, similarity_rank
+from service.planner import explain_rows, filter_stats
+from service.registry import property_registry
 from tables import models
 import schemas
 
+
+def use_facet_index() -> bool:
+    return settings.CATALOG_BACKEND == "index" and facet_index.ready and not facet_index.stale
+
+
 async def get_property(db: AsyncSession, property_uid: str):
     result = await db.execute(
-        select(models.Property).where(models.Property.uid == property_uid))
+        select(models.Property).where(models.Property.uid == property_uid)
+        .options(selectinload(models.Property.value_items)))
     return result.scalars().first()
 
 
 async def create_property(db: AsyncSession, property: schemas.PropertyCreate):
+    if type(property.values) != int:
+        for value in property.values or []:
+            value.uid = value.uid or str(uuid.uuid4())
+
     db_property = models.Property(
         uid=property.uid,
         name=property.name,
         type=property.type,
-        values=property.values if type(property.values) == int else [v.dict() for v in property.values]
+        values=property.values if type(property.values) == int else [v.dict() for v in property.values or []]
     )
+    if property.type == "list":
+        db_property.value_items = [
+            models.PropertyValue(uid=value.uid, value=value.value, position=position)
+            for position, value in enumerate(property.values or [])
+        ]
     db.add(db_property)
+    await events.publish(db, "properties", [property.uid])
     await db.commit()
     await db.refresh(db_property)
+    property_registry.bump()
+    catalog_generation.bump()
+    if facet_index.ready:
+        facet_index.set_property(db_property.uid, db_property.type)
     return db_property
 
 
@@ -31,17 +64,35 @@ async def delete_property(db: AsyncSession, property_uid: str):
     property = result.scalars().first()
     if property:
         await db.delete(property)
+        await events.publish(db, "properties", [property_uid])
         await db.commit()
+        property_registry.bump()
+        catalog_generation.bump()
+        product_cache.invalidate_tag(property_uid)
+        if facet_index.ready:
+            facet_index.remove_property(property_uid)
     return property
 
 
 async def get_product(db: AsyncSession, product_uid: str):
+    if settings.PRODUCT_DOCUMENTS:
+        # one row: uids of the properties are taken from the document
+        result = await db.execute(
+            select(models.Product.uid, models.Product.name, documents.property_uids_column())
+            .where(models.Product.uid == product_uid))
+        product = result.first()
+        if product:
+            await property_registry.ensure_known(db, product.properties)
+        return product
+
     result = await db.execute(
-        select(models.Product).where(models.Product.uid == product_uid)        .options(
-            selectinload(models.Product.properties)
-            .selectinload(models.ProductProperty.property)  # Загружаем связанное свойство
-        ))
-    return result.scalars().first()
+        select(models.Product).where(models.Product.uid == product_uid)
+        .options(selectinload(models.Product.properties)))
+    product = result.scalars().first()
+    if product:
+        # names and values of properties come from the registry
+        await property_registry.ensure_known(db, {prop.property_uid for prop in product.properties})
+    return product
 
 
 async def get_products(
@@ -50,70 +101,206 @@ async def get_products(
         limit: int = 10,
         name: str = None,
         filters: dict = None,
-        sort: str = "uid"
+        sort: str = "uid",
+        after: tuple = None,
+        min_similarity: float = None,
+        count: str = "exact"
 ):
-    query = select(models.Product).options(
-            selectinload(models.Product.properties)
-            .selectinload(models.ProductProperty.property)
-        )
+    """Страница товаров и их общее число.
+
+    count: exact - count(*) по всему фильтру, estimate - оценка (см.
+    estimate_count), none - без подсчета, вместо числа None.
+    """
+    query = select(models.Product)
 
-    if name:
-        query = query.where(models.Product.name.ilike(f"%{name}%"))
+    if name and min_similarity is not None:
+        await set_similarity_threshold(db, min_similarity)
+    elif use_facet_index():
+        bitmap = facet_index.match(name=name, filters=filters)
+        products = await fetch_products(db, facet_index.page(bitmap, sort=sort, skip=skip, limit=limit, after=after))
+        # the bitmap count is exact and free, so estimate is exact too
+        return products, bitmap.bit_count() if count != "none" else None
 
     if filters:
-        for prop_uid, values in filters.items():
-            if isinstance(values, dict):  # range filter for int
-                subq = select(models.ProductProperty.product_uid).where(
-                    models.ProductProperty.property_uid == prop_uid)
-
-                if 'from' in values:
-                    subq = subq.where(models.ProductProperty.value >= values['from'])
-                if 'to' in values:
-                    subq = subq.where(models.ProductProperty.value <= values['to'])
-
-                query = query.where(models.Product.uid.in_(subq))
-            else:  # list of values for list property
-                subq = select(models.ProductProperty.product_uid).where(
-                    and_(
-                        models.ProductProperty.property_uid == prop_uid,
-                        models.ProductProperty.value_uid.in_(values)
-                    )
-                )
-                query = query.where(models.Product.uid.in_(subq))
+        await filter_stats.ensure_loaded(db)
+    query = apply_product_filters(query, name=name, filters=filters, min_similarity=min_similarity)
 
     # Sorting
-    if sort == "name":
-        query = query.order_by(models.Product.name)
+    if name and min_similarity is not None:
+        order = (similarity_rank(name), models.Product.uid)
+    elif sort == "name":
+        order = (models.Product.name, models.Product.uid)
     else:
-        query = query.order_by(models.Product.uid)
+        order = (models.Product.uid,)
+    query = query.order_by(*order)
 
     # Count before pagination
-    count_query = select(func.count()).select_from(query)
-    count_result = await db.execute(count_query)
-    total = count_result.scalar()
+    if count == "exact":
+        total = (await db.execute(select(func.count()).select_from(query))).scalar()
+    elif count == "estimate":
+        total = await estimate_count(db, query, name=name, filters=filters, min_similarity=min_similarity)
+    else:
+        total = None
 
     # Pagination
-    query = query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    products = result.scalars().all()
+    if after is not None:
+        # keyset: seek past the last row of the previous page
+        products = list(await fetch_listing(db, query.where(seek_condition(sort, after)).limit(limit), order))
+        if sort == "name" and after[0] is not None and len(products) < limit:
+            # the non-NULL names are exhausted, continue in the NULL tail
+            products += await fetch_listing(
+                db, query.where(seek_condition(sort, (None, ""))).limit(limit - len(products)), order)
+    else:
+        products = await fetch_listing(db, query.offset(skip).limit(limit), order)
+    await ensure_properties_known(db, products)
 
     return products, total
 
 
+async def estimate_count(db: AsyncSession, query, name: str = None, filters: dict = None,
+                         min_similarity: float = None) -> int:
+    """Число товаров под фильтром без count(*).
+
+    Точное число берется из кэша фасетов, если /catalog/filter/ уже считал этот
+    фильтр; весь каталог и одно list свойство - из счетчиков фасетов
+    (filter_stats, устаревают не больше чем на PLANNER_STATS_TTL); остальное -
+    оценка планировщика Postgres по EXPLAIN.
+    """
+    cached = facet_cache.peek((catalog_generation.value, filter_signature(name, filters, min_similarity)))
+    if cached is not None:
+        return cached["count"]
+
+    if not name:
+        await filter_stats.ensure_loaded(db)
+        if not filters:
+            return filter_stats.total
+        if len(filters) == 1:
+            prop_uid, values = next(iter(filters.items()))
+            if not isinstance(values, dict):
+                return int(filter_stats.estimate(prop_uid, values))
+
+    await filter_stats.ensure_loaded(db)
+    # the planner can overshoot on stale statistics, the catalog size is an upper bound
+    return min(await explain_rows(db, query.order_by(None)), filter_stats.total)
+
+
+async def fetch_listing(db: AsyncSession, query, order: tuple = ()) -> list:
+    """Товары страницы каталога по запросу select(Product) с фильтрами и пагинацией.
+
+    projection: строки (uid, name, properties), где properties - uid свойств
+    товара, собранные в базе json_agg в LATERAL подзапросе, без объектов ORM.
+    Сначала выбирается страница, потом свойства только ее товаров: иначе
+    json_agg считался бы и для строк, пропущенных OFFSET. Порядок страницы
+    сохраняется через row_number() по тем же order.
+    orm: модели Product со свойствами через selectinload.
+    """
+    if settings.CATALOG_LISTING == "orm":
+        result = await db.execute(query.options(selectinload(models.Product.properties)))
+        return result.scalars().all()
+
+    if settings.PRODUCT_DOCUMENTS:
+        result = await db.execute(query.with_only_columns(
+            models.Product.uid, models.Product.name, documents.property_uids_column()))
+        return result.all()
+
+    page = query.with_only_columns(
+        models.Product.uid, models.Product.name, func.row_number().over(order_by=order).label("position")
+    ).subquery("page")
+
+    pp = models.ProductProperty
+    properties = (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(pp.property_uid, pp.id)), literal_column("'[]'::json")
+        ).label("properties"))
+        .where(pp.product_uid == page.c.uid)
+        .lateral("product_properties")
+    )
+    result = await db.execute(
+        select(page.c.uid, page.c.name, properties.c.properties)
+        .join(properties, true())
+        .order_by(page.c.position))
+    return result.all()
+
+
+async def fetch_products(db: AsyncSession, uids: list) -> list:
+    """Товары страницы по списку uid, в порядке списка."""
+    products = await fetch_listing(db, select(models.Product).where(models.Product.uid.in_(uids)))
+    products = {product.uid: product for product in products}
+    products = [products[uid] for uid in uids if uid in products]
+    await ensure_properties_known(db, products)
+    return products
+
+
+async def ensure_properties_known(db: AsyncSession, products):
+    await property_registry.ensure_known(
+        db, {uid for product in products for uid in property_uids(product)})
+
+
+def seek_condition(sort: str, after: tuple):
+    """Условие keyset для одного диапазона ix_products_name_uid / первичного ключа.
+
+    Для sort=name с непустым name это только строки с непустым именем: NULL имена
+    идут последними, их читает отдельный seek с after=(None, "").
+    """
+    if sort == "name":
+        name, uid = after
+        if name is None:  # NULL names are sorted last
+            return and_(models.Product.name.is_(None), models.Product.uid > uid)
+        return tuple_(models.Product.name, models.Product.uid) > tuple_(name, uid)
+    return models.Product.uid > after[0]
+
+
+# range of the Integer column product_properties.value_int
+INT_VALUE_MIN, INT_VALUE_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def parse_int_value(value) -> Optional[int]:
+    """Значение int свойства или None, если это не целое число в пределах int4."""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if INT_VALUE_MIN <= value <= INT_VALUE_MAX else None
+
+
+def product_property_values(prop: schemas.ProductPropertyBase, prop_type: str) -> tuple:
+    """(value_uid, value_int) для строки product_properties."""
+    if prop_type == "list":
+        return prop.value_uid, None
+    return None, parse_int_value(prop.value) if prop.value is not None else None
+
+
 async def create_product(db: AsyncSession, product: schemas.ProductCreate):
-    db_product = models.Product(uid=product.uid, name=product.name)
-    db.add(db_product)
+    await property_registry.ensure_loaded(db)
+    property_types = property_registry.types()
 
+    db_props = []
     for prop in product.properties:
-        db_prop = models.ProductProperty(
+        value_uid, value_int = product_property_values(prop, property_types.get(prop.uid))
+        db_props.append(models.ProductProperty(
             product_uid=product.uid,
             property_uid=prop.uid,
-        )
-        db.add(db_prop)
+            value_uid=value_uid,
+            value_int=value_int,
+        ))
 
+    # properties are set through the relationship, so the response is built
+    # from this object without reading the product back
+    db_product = models.Product(
+        uid=product.uid, name=product.name, properties=db_props,
+        document=documents.build_document((p.property_uid, p.value_uid, p.value_int) for p in db_props))
+    db.add(db_product)
+
+    await counters.apply_deltas(
+        db, added=[(p.property_uid, p.value_uid, p.value_int) for p in db_props], products=1)
+    await events.publish(db, "products", [product.uid])
     await db.commit()
-    await db.refresh(db_product)
+    product_cache.invalidate(product.uid)
+    catalog_generation.bump()
+    if facet_index.ready:
+        facet_index.add_product(product.uid, product.name, [
+            (p.property_uid, p.value_uid if p.value_uid is not None else p.value_int) for p in db_props
+        ])
     return db_product
 
 
@@ -122,124 +309,198 @@ async def delete_product(db: AsyncSession, product_uid: str):
         select(models.Product).where(models.Product.uid == product_uid))
     product = result.scalars().first()
     if product:
+        pp = models.ProductProperty
+        removed = (await db.execute(
+            select(pp.property_uid, pp.value_uid, pp.value_int).where(pp.product_uid == product_uid))).all()
         await db.delete(product)
+        await db.flush()
+        await counters.apply_deltas(db, removed=removed, products=-1)
+        await events.publish(db, "products", [product_uid])
         await db.commit()
+        product_cache.invalidate(product_uid)
+        catalog_generation.bump()
+        if facet_index.ready:
+            facet_index.remove_product(product_uid)
     return product
 
 
-async def get_filter_data(db: AsyncSession, name: str = None, filters: dict = None):
-    # Base query to get filtered product IDs
-    product_query = select(models.Product.uid)
+def validate_product(product: schemas.ProductCreate):
+    """Проверить свойства товара по реестру свойств. Вернуть текст ошибки или None."""
+    for prop in product.properties:
+        property = property_registry.get(prop.uid)
+        if property is None:
+            return f"Property {prop.uid} not found"
+
+        if property.type == "list":
+            if not prop.value_uid:
+                return f"Property {prop.uid} requires value_uid"
+            if property_registry.value_owner(prop.value_uid) != prop.uid:
+                return f"Value {prop.value_uid} not found in property {prop.uid}"
+        else:
+            if prop.value is None or parse_int_value(prop.value) is None:
+                return f"Property {prop.uid} requires integer value between {INT_VALUE_MIN} and {INT_VALUE_MAX}"
+    return None
+
+
+async def upsert_products(db: AsyncSession, products: list) -> dict:
+    """Создать или обновить пачку товаров за фиксированное число запросов.
+
+    Свойства и значения проверяются по реестру свойств, товары пишутся
+    одним INSERT ... ON CONFLICT из unnest() массивов, свойства товаров
+    заменяются одним DELETE и одним INSERT.
+    """
+    await property_registry.ensure_known(
+        db, {prop.uid for product in products for prop in product.properties})
+    property_types = property_registry.types()
+
+    errors = []
+    valid = {}
+    for index, product in enumerate(products):
+        error = validate_product(product)
+        if error is None and product.uid in valid:
+            error = "Duplicate product uid in batch"
+        if error:
+            errors.append({"index": index, "uid": product.uid, "detail": error})
+        else:
+            valid[product.uid] = product
 
-    if name:
-        product_query = product_query.where(models.Product.name.ilike(f"%{name}%"))
+    if not valid:
+        return {"created": 0, "updated": 0, "errors": errors}
 
-    if filters:
-        for prop_uid, values in filters.items():
-            if isinstance(values, dict):  # range filter
-                subq = select(models.ProductProperty.product_uid).where(
-                    models.ProductProperty.property_uid == prop_uid)
-
-                if 'from' in values:
-                    subq = subq.where(models.ProductProperty.value >= values['from'])
-                if 'to' in values:
-                    subq = subq.where(models.ProductProperty.value <= values['to'])
-
-                product_query = product_query.where(models.Product.uid.in_(subq))
-            else:  # list values
-                subq = select(models.ProductProperty.product_uid).where(
-                    and_(
-                        models.ProductProperty.property_uid == prop_uid,
-                        models.ProductProperty.value_uid.in_(values)
-                    )
-                )
-                product_query = product_query.where(models.Product.uid.in_(subq))
-
-    product_result = await db.execute(product_query)
-    product_ids = [p[0] for p in product_result.all()]
-
-    count = len(product_ids)
-
-    properties_data = {}
-
-    properties_result = await db.execute(select(models.Property))
-    properties = properties_result.scalars().all()
-
-    for prop in properties:
-        if prop.type == "list":
-            values_data = {}
-            for value in prop.values:
-                count_query = select(func.count()).where(
-                    and_(
-                        models.ProductProperty.property_uid == prop.uid,
-                        models.ProductProperty.value_uid == value["value_uid"],
-                        models.ProductProperty.product_uid.in_(product_ids)
-                    )
-                )
-                value_count = (await db.execute(count_query)).scalar()
-                values_data[value["value_uid"]] = value_count
-
-            properties_data[prop.uid] = values_data
-        else:
-            min_query = select(func.min(models.ProductProperty.value)).where(
-                and_(
-                    models.ProductProperty.property_uid == prop.uid,
-                    models.ProductProperty.product_uid.in_(product_ids)
-                ))
-            max_query = select(func.max(models.ProductProperty.value)).where(
-                and_(
-                    models.ProductProperty.property_uid == prop.uid,
-                    models.ProductProperty.product_uid.in_(product_ids)
-                ))
-
-            min_val = (await db.execute(min_query)).scalar()
-            max_val = (await db.execute(max_query)).scalar()
-
-            properties_data[prop.uid] = {
-                "min_value": min_val,
-                "max_value": max_val
-            }
-
-    return {
-        "count": count,
-        "properties": properties_data
+    product_values = {
+        product.uid: [
+            (prop.uid, *product_property_values(prop, property_types[prop.uid])) for prop in product.properties
+        ]
+        for product in valid.values()
     }
+    rows = func.unnest(
+        bindparam("uids", list(valid), type_=ARRAY(String)),
+        bindparam("names", [product.name for product in valid.values()], type_=ARRAY(String)),
+        # documents go as json text: a jsonb[] parameter would read the lists as nested arrays
+        bindparam("documents", [json.dumps(documents.build_document(values), ensure_ascii=False)
+                                for values in product_values.values()], type_=ARRAY(String)),
+    ).table_valued("uid", "name", "document").render_derived()
+    upsert = pg_insert(models.Product).from_select(
+        ["uid", "name", "document"], select(rows.c.uid, rows.c.name, cast(rows.c.document, JSONB)))
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[models.Product.uid],
+        set_={"name": upsert.excluded.name, "document": upsert.excluded.document},
+    ).returning(models.Product.uid, literal_column("xmax = 0").label("inserted"))
+    written = (await db.execute(upsert)).all()
+
+    props = [(product_uid, *values) for product_uid, rows in product_values.items() for values in rows]
+    pp = models.ProductProperty
+    removed = (await db.execute(
+        delete(pp)
+        .where(pp.product_uid == any_(bindparam("uids", list(valid), type_=ARRAY(String))))
+        .returning(pp.property_uid, pp.value_uid, pp.value_int))).all()
+    if props:
+        prop_rows = func.unnest(
+            bindparam("product_uids", [p[0] for p in props], type_=ARRAY(String)),
+            bindparam("property_uids", [p[1] for p in props], type_=ARRAY(String)),
+            bindparam("value_uids", [p[2] for p in props], type_=ARRAY(String)),
+            bindparam("value_ints", [p[3] for p in props], type_=ARRAY(Integer)),
+        ).table_valued("product_uid", "property_uid", "value_uid", "value_int").render_derived()
+        await db.execute(
+            pg_insert(models.ProductProperty).from_select(
+                ["product_uid", "property_uid", "value_uid", "value_int"],
+                select(prop_rows.c.product_uid, prop_rows.c.property_uid,
+                       prop_rows.c.value_uid, prop_rows.c.value_int)))
+
+    created = sum(1 for row in written if row.inserted)
+    await counters.apply_deltas(db, added=[p[1:] for p in props], removed=removed, products=created)
+    await events.publish(db, "products", valid)
+    await db.commit()
 
+    for product_uid in valid:
+        product_cache.invalidate(product_uid)
+    catalog_generation.bump()
+    if facet_index.ready:
+        for product in valid.values():
+            facet_index.add_product(product.uid, product.name, [
+                (prop.uid, prop.value_uid if property_types[prop.uid] == "list" else parse_int_value(prop.value))
+                for prop in product.properties
+            ])
 
-async def load_test_data(db: AsyncSession, data: dict):
-
-    for prop_data in data["properties"]:
-        prop = models.Property(
-            uid=prop_data["uid"],
-            name=prop_data["name"],
-            type=prop_data["type"],
-            values=[{'value': item['value']} for item in prop_data.get("values")] if prop_data.get("values") else prop_data.get("value")
-        )
-        db.add(prop)
-
-    for product_data in data["products"]:
-        product = models.Product(
-            uid=product_data["uid"],
-            name=product_data["name"]
-        )
-        db.add(product)
-
-        for prop_data in product_data["properties"]:
-            prop_type = next(
-                (p["type"] for p in data["properties"] if p["uid"] == prop_data["uid"]),
-                None
-            )
-
-            if prop_type == "list":
-                product_prop = models.ProductProperty(
-                    product_uid=product_data["uid"],
-                    property_uid=prop_data["uid"],
-                )
-            else:
-                product_prop = models.ProductProperty(
-                    product_uid=product_data["uid"],
-                    property_uid=prop_data["uid"],
-                )
-            db.add(product_prop)
-
-    await db.commit()
\ No newline at end of file
+    return {"created": created, "updated": len(written) - created, "errors": errors}
+
+
+async def search_catalog(
+        db: AsyncSession,
+        skip: int = 0,
+        limit: int = 10,
+        name: str = None,
+        filters: dict = None,
+        sort: str = "uid",
+        min_similarity: float = None
+):
+    """Страница товаров, общее число и фасеты одного фильтра из одного множества товаров.
+
+    С facet_index страница и фасеты считаются по одной битовой карте. В базе
+    множество товаров под фильтром - один CTE, из которого один запрос берет и
+    фасеты, и uid страницы (facets.build_facet_query с page), затем читаются
+    товары страницы; все в одной сессии. Фасеты из facet_cache и счетчиков
+    (весь каталог) не требуют множества, тогда читается только страница.
+    """
+    if use_facet_index() and min_similarity is None:
+        bitmap = facet_index.match(name=name, filters=filters)
+        products = await fetch_products(db, facet_index.page(bitmap, sort=sort, skip=skip, limit=limit))
+        count, value_counts, ranges = facet_index.facets(bitmap)
+        await property_registry.ensure_loaded(db)
+        return products, facets.build_filter_response(count, property_registry.all(), value_counts, ranges)
+
+    key = (catalog_generation.value, filter_signature(name, filters, min_similarity))
+    filter_data = facet_cache.get(key)
+    if filter_data is not None or (not name and not filters):
+        products, _ = await get_products(
+            db, skip=skip, limit=limit, name=name, filters=filters, sort=sort,
+            min_similarity=min_similarity, count="none")
+        if filter_data is None:
+            filter_data = await get_filter_data(db, name=name, filters=filters, min_similarity=min_similarity)
+        return products, filter_data
+
+    if name and min_similarity is not None:
+        await set_similarity_threshold(db, min_similarity)
+    if filters:
+        await filter_stats.ensure_loaded(db)
+    facet_rows = (await db.execute(facets.build_facet_query(
+        name=name, filters=filters, min_similarity=min_similarity, page=(sort, skip, limit)))).all()
+    uids = next(row.page for row in facet_rows if row.property_uid is None)
+    count, value_counts, ranges = counters.parse_facet_rows(facet_rows)
+
+    products = await fetch_products(db, uids)
+    await property_registry.ensure_loaded(db)
+    filter_data = facets.build_filter_response(count, property_registry.all(), value_counts, ranges)
+    facet_cache.set(key, filter_data)
+    return products, filter_data
+
+
+async def get_filter_data(db: AsyncSession, name: str = None, filters: dict = None,
+                          min_similarity: float = None):
+    """Фасеты каталога через кэш по канонической сигнатуре фильтра.
+
+    В ключ входит catalog_generation, поэтому любая запись товаров или свойств
+    делает старые записи недостижимыми.
+    """
+    key = (catalog_generation.value, filter_signature(name, filters, min_similarity))
+    filter_data = facet_cache.get(key)
+    if filter_data is None:
+        filter_data = await compute_filter_data(db, name=name, filters=filters, min_similarity=min_similarity)
+        facet_cache.set(key, filter_data)
+    return filter_data
+
+
+async def compute_filter_data(db: AsyncSession, name: str = None, filters: dict = None,
+                              min_similarity: float = None):
+    if use_facet_index() and min_similarity is None:
+        count, value_counts, ranges = facet_index.facets(facet_index.match(name=name, filters=filters))
+        await property_registry.ensure_loaded(db)
+        return facets.build_filter_response(count, property_registry.all(), value_counts, ranges)
+
+    if not name and not filters:
+        # the whole catalog: answered from the counter tables
+        count, value_counts, ranges = await counters.read_facets(db)
+        await property_registry.ensure_loaded(db)
+        return facets.build_filter_response(count, property_registry.all(), value_counts, ranges)
+
+    return await facets.compute_facets(db, name=name, filters=filters, min_similarity=min_similarity)
@@ -0,0 +1,94 @@
+"""Документ товара: products.document - свойства товара одним JSONB массивом.
+
+Элементы в порядке product_properties.id: {"uid": <свойство>, "value_uid": <значение>}
+для list свойств и {"uid": <свойство>, "value": <число>} для int. Документ пишется
+вместе с product_properties при каждой записи товара; фильтры по list свойствам
+с PRODUCT_DOCUMENTS проверяются containment (document @> ...) по GIN индексу
+jsonb_path_ops вместо подзапросов к product_properties.
+"""
+import time
+
+from sqlalchemy import String, and_, any_, bindparam, case, func, literal_column, or_, update
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import models
+
+
+def build_document(properties) -> list:
+    """Документ по строкам (property_uid, value_uid, value_int)."""
+    return [
+        {"uid": property_uid, "value_uid": value_uid} if value_uid is not None
+        else {"uid": property_uid, "value": value_int}
+        for property_uid, value_uid, value_int in properties
+    ]
+
+
+def property_uids_column():
+    """uid свойств товара из документа, в порядке документа: колонка properties строк товаров."""
+    return func.jsonb_path_query_array(
+        models.Product.document, literal_column("'$[*].uid'::jsonpath")).label("properties")
+
+
+def split_filters(filters: dict) -> tuple:
+    """(условие containment по list фильтрам или None, оставшиеся range фильтры).
+
+    Свойства с одним значением проверяются одним document @> [...] на все сразу,
+    с несколькими - OR по значениям. Диапазоны в jsonb_path_ops не индексируются,
+    поэтому остаются на product_properties.
+    """
+    document = models.Product.document
+    single = []
+    conditions = []
+    ranges = {}
+    for prop_uid, values in filters.items():
+        if isinstance(values, dict):
+            ranges[prop_uid] = values
+        elif len(set(values)) == 1:
+            single.append({"uid": prop_uid, "value_uid": values[0]})
+        else:
+            conditions.append(or_(*(
+                document.contains([{"uid": prop_uid, "value_uid": value}]) for value in sorted(set(values))
+            )))
+
+    if single:
+        conditions.insert(0, document.contains(single))
+    return (and_(*conditions) if conditions else None), ranges
+
+
+def document_query():
+    """Документ товара, собранный из product_properties (для заполнения существующих строк)."""
+    pp = models.ProductProperty
+    element = case(
+        (pp.value_uid.is_not(None), func.jsonb_build_object("uid", pp.property_uid, "value_uid", pp.value_uid)),
+        else_=func.jsonb_build_object("uid", pp.property_uid, "value", pp.value_int),
+    )
+    return (
+        select(func.coalesce(func.jsonb_agg(aggregate_order_by(element, pp.id)), literal_column("'[]'::jsonb")))
+        .where(pp.product_uid == models.Product.uid)
+        .scalar_subquery()
+    )
+
+
+async def backfill(db: AsyncSession, batch_size: int = 10000) -> dict:
+    """Заполнить products.document для всех товаров, пачками по uid с коммитом на пачку."""
+    started = time.perf_counter()
+    updated = 0
+    last_uid = ""
+    while True:
+        uids = (await db.execute(
+            select(models.Product.uid).where(models.Product.uid > last_uid)
+            .order_by(models.Product.uid).limit(batch_size))).scalars().all()
+        if not uids:
+            break
+        await db.execute(
+            update(models.Product)
+            .where(models.Product.uid == any_(bindparam("uids", uids, type_=ARRAY(String))))
+            .values(document=document_query())
+            .execution_options(synchronize_session=False))
+        await db.commit()
+        updated += len(uids)
+        last_uid = uids[-1]
+
+    return {"products": updated, "seconds": round(time.perf_counter() - started, 3)}
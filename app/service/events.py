@@ -0,0 +1,245 @@
+"""Шина инвалидации кэшей между воркерами через Postgres LISTEN/NOTIFY.
+
+Запись публикует событие pg_notify в своей транзакции (publish), поэтому
+другие воркеры получают его только после коммита, а откат его отменяет. Каждый
+воркер держит одно отдельное от пула asyncpg соединение с LISTEN и применяет
+чужие события к своим кэшам. Пока соединения нет, события теряются, поэтому
+после переподключения кэши воркера сбрасываются целиком.
+
+События: products (uid товаров или None - все), properties (uid свойств),
+catalog (весь каталог, например загрузка дампа). Тем же запросом publish
+увеличивает версию каталога в catalog_state (ETag), новая версия приходит в
+событии.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import asyncpg
+from sqlalchemy import Text, cast, event, func, literal
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from db.db import async_session, read_router
+from service.cache import catalog_generation, catalog_version, facet_cache, product_cache
+from service.facet_index import facet_index
+from service.planner import filter_stats
+from service.registry import property_registry
+from tables import models
+
+logger = logging.getLogger("catalog.events")
+
+# NOTIFY payload is limited to 8000 bytes, larger uid lists are sent as "all"
+MAX_PAYLOAD = 7900
+
+
+async def publish(db: AsyncSession, kind: str, uids: Optional[Iterable[str]] = None, sticky: bool = True):
+    """Отправить событие в транзакции сессии db; вызывать до commit.
+
+    sticky - после события чтения идут на primary (ReadRouter.note_write); загрузчик
+    не задерживает так реплики на каждой пачке, только на последней.
+    """
+    if sticky:
+        read_router.note_write()
+
+    state = models.CatalogState
+    bump = insert(state).values(id=1, version=1, updated_at=func.now())
+    bump = bump.on_conflict_do_update(
+        index_elements=[state.id], set_={"version": state.version + 1, "updated_at": func.now()})
+    columns = [state.version, state.updated_at]
+
+    if settings.INVALIDATION_BUS:
+        message = {
+            "origin": invalidation_bus.origin, "kind": kind, "sticky": sticky,
+            "uids": sorted(set(uids)) if uids is not None else None,
+        }
+        payload = json.dumps(message)
+        if len(payload.encode()) > MAX_PAYLOAD:
+            payload = json.dumps({**message, "uids": None})
+        # the new version goes into the same notification
+        version = func.jsonb_build_object(
+            "version", state.version, "updated_at", func.extract("epoch", state.updated_at))
+        columns.append(func.pg_notify(
+            settings.INVALIDATION_CHANNEL, cast(cast(literal(payload), JSONB).op("||")(version), Text)))
+
+    row = (await db.execute(bump.returning(*columns))).first()
+    # applied to catalog_version after commit, see apply_committed_version
+    db.sync_session.info["catalog_version"] = (row.version, row.updated_at)
+
+
+@event.listens_for(Session, "after_commit")
+def apply_committed_version(session):
+    pending = session.info.pop("catalog_version", None)
+    if pending is not None:
+        catalog_version.advance(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_pending_version(session):
+    session.info.pop("catalog_version", None)
+
+
+class InvalidationBus:
+    """LISTEN соединение воркера: переподключение с паузой до INVALIDATION_RECONNECT_MAX секунд."""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex  # events of this worker are already applied locally
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+        self.flushes = 0
+        self._task = None
+        self._rebuild = None
+        # changes not applied to facet_index yet: product uids, property uids, full rebuild
+        self._pending_products = set()
+        self._pending_properties = set()
+        self._pending_full = False
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._rebuild):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = self._rebuild = None
+
+    async def _run(self):
+        delay = 1
+        missed = False  # something could have been written without us listening
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(
+                    settings.get_database_url().replace("postgresql+asyncpg://", "postgresql://"))
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(settings.INVALIDATION_CHANNEL, self._on_notify)
+                state = await connection.fetchrow("SELECT version, updated_at FROM catalog_state WHERE id = 1")
+                if state is not None:
+                    catalog_version.set(state["version"], state["updated_at"])
+                self.connected = True
+                if missed:
+                    self.flush()
+                delay = 1
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=settings.INVALIDATION_PING_SECONDS)
+                    except asyncio.TimeoutError:
+                        # a dropped TCP connection is only noticed on the next query
+                        await connection.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("invalidation listener: %s: %s", e.__class__.__name__, e)
+            finally:
+                self.connected = False
+                if connection is not None:
+                    connection.terminate()
+
+            missed = True
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.INVALIDATION_RECONNECT_MAX)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("invalidation listener: bad payload %r", payload[:200])
+            return
+        if event.get("origin") == self.origin:
+            return
+        self.received += 1
+        self.apply(event)
+
+    def apply(self, event: dict):
+        kind, uids = event.get("kind"), event.get("uids")
+        if event.get("version") is not None:
+            catalog_version.advance(
+                event["version"], datetime.fromtimestamp(float(event["updated_at"]), timezone.utc))
+        if event.get("sticky", True):
+            read_router.note_write()
+        if kind == "products":
+            catalog_generation.bump()
+            if uids is None:
+                product_cache.clear()
+            else:
+                for uid in uids:
+                    product_cache.invalidate(uid)
+            self.refresh_index(products=uids or (), full=uids is None)
+        elif kind == "properties":
+            property_registry.bump()
+            catalog_generation.bump()
+            for uid in uids or ():
+                product_cache.invalidate_tag(uid)
+            self.refresh_index(properties=uids or (), full=uids is None)
+        else:
+            self.flush()
+
+    def flush(self):
+        """Сбросить все кэши процесса."""
+        self.flushes += 1
+        property_registry.bump()
+        catalog_generation.bump()
+        product_cache.clear()
+        facet_cache.clear()
+        filter_stats.loaded_at = None
+        self.refresh_index(full=True)
+
+    def refresh_index(self, products=(), properties=(), full: bool = False):
+        """Применить изменения к facet_index в фоне: товары и свойства по uid, full - перестроить целиком.
+
+        Пока изменения не применены, индекс помечен stale и каталог читается из
+        базы; после применения catalog_generation увеличивается еще раз, чтобы
+        facet_cache не отдавал фасеты, посчитанные до этого.
+        """
+        if not facet_index.ready:
+            return
+        facet_index.stale = True
+        self._pending_products.update(products)
+        self._pending_properties.update(properties)
+        self._pending_full = self._pending_full or full
+        if self._rebuild is None or self._rebuild.done():
+            self._rebuild = asyncio.create_task(self._refresh_index())
+
+    async def _refresh_index(self):
+        while self._pending_full or self._pending_products or self._pending_properties:
+            full, products, properties = self._pending_full, self._pending_products, self._pending_properties
+            self._pending_full, self._pending_products, self._pending_properties = False, set(), set()
+            try:
+                async with async_session() as db:
+                    if full:
+                        await facet_index.build(db)
+                    else:
+                        # properties first, product values are indexed by property type
+                        if properties:
+                            await facet_index.refresh_properties(db, properties)
+                        if products:
+                            await facet_index.refresh_products(db, products)
+            except Exception as e:
+                # the index stays stale until the next event, which rebuilds it completely
+                logger.warning("facet index refresh failed: %s: %s", e.__class__.__name__, e)
+                self._pending_full = True
+                return
+        facet_index.stale = False
+        catalog_generation.bump()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.INVALIDATION_BUS,
+            "connected": self.connected,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "flushes": self.flushes,
+        }
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from service.filters import apply_product_filters
+from service.planner import filter_stats
+from service.registry import property_registry
+from tables import models
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+
+async def iter_product_batches(db: AsyncSession, name: str = None, filters: dict = None,
+                               batch_size: int = 1000):
+    """Товары каталога пачками по batch_size в порядке uid.
+
+    Товары читаются серверным курсором (stream + yield_per), свойства - одним
+    запросом на пачку, поэтому память не зависит от размера каталога.
+    Каждый товар - dict в формате товара дампа: uid, name, properties с
+    value_uid/value. Свойств каталога в выгрузке нет, это не дамп для import.
+    Реестр свойств должен быть загружен до начала выгрузки.
+    """
+    if filters:
+        await filter_stats.ensure_loaded(db)
+
+    query = apply_product_filters(
+        select(models.Product.uid, models.Product.name), name=name, filters=filters
+    ).order_by(models.Product.uid).execution_options(yield_per=batch_size)
+
+    pp = models.ProductProperty
+    result = await db.stream(query)
+    async for rows in result.partitions(batch_size):
+        products = {row.uid: {"uid": row.uid, "name": row.name, "properties": []} for row in rows}
+
+        prop_rows = (await db.execute(
+            select(pp.product_uid, pp.property_uid, pp.value_uid, pp.value_int)
+            .where(pp.product_uid.in_(list(products)))
+            .order_by(pp.product_uid, pp.id))).all()
+        await property_registry.ensure_known(db, {row.property_uid for row in prop_rows})
+
+        for row in prop_rows:
+            if row.value_uid is not None:
+                products[row.product_uid]["properties"].append(
+                    {"uid": row.property_uid, "value_uid": row.value_uid,
+                     "value": property_registry.value_text(row.value_uid)})
+            else:
+                products[row.product_uid]["properties"].append({"uid": row.property_uid, "value": row.value_int})
+
+        yield list(products.values())
+
+
+async def ndjson_chunks(batches):
+    async for products in batches:
+        if orjson is not None:
+            yield b"".join(orjson.dumps(product, option=orjson.OPT_APPEND_NEWLINE) for product in products)
+        else:
+            yield "".join(json.dumps(product, ensure_ascii=False) + "\n" for product in products).encode()
+
+
+async def csv_chunks(batches):
+    """CSV: uid, name и по колонке на свойство (uid свойства в заголовке).
+
+    Реестр свойств должен быть загружен до начала выгрузки.
+    """
+    columns = [prop.uid for prop in property_registry.all()]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["uid", "name", *columns])
+
+    async for products in batches:
+        for product in products:
+            values = {prop["uid"]: prop["value"] for prop in product["properties"]}
+            writer.writerow([product["uid"], product["name"], *(values.get(uid, "") for uid in columns)])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,323 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import models
+
+# removed ids kept for reuse before the index is renumbered
+COMPACT_MIN_FREE = 1024
+
+
+class FacetIndex:
+    """Индекс каталога в памяти процесса.
+
+    Каждому товару выдается плотный числовой id, наборы товаров хранятся как
+    битовые карты (python int). Для каждой пары (свойство, значение) list свойства
+    хранится своя карта, для каждого int свойства - отсортированная колонка
+    (value, id). Фильтр по списку - OR карт внутри свойства и AND между
+    свойствами, диапазон - бинарный поиск по колонке, счетчики фасетов - popcount.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.stale = False  # the database has changes not applied yet, see InvalidationBus
+        self._reset()
+
+    def _reset(self):
+        self._ids = {}        # product uid -> id
+        self._uids = []       # id -> product uid
+        self._names = []      # id -> product name
+        self._free = []       # ids of removed products, reused by add_product
+        self._alive = 0
+        self._types = {}      # property uid -> 'list' | 'int'
+        self._bitmaps = {}    # (property uid, value uid) -> bitmap
+        self._columns = {}    # property uid -> sorted [(value, id)]
+        self._product_values = {}  # id -> [(property uid, value)]
+        self._by_uid = []     # sorted [(uid, id)]
+        self._by_name = []    # sorted [(*name_key(name), uid, id)]
+
+    async def build(self, db: AsyncSession):
+        """Построить индекс заново по таблицам каталога."""
+        properties = (await db.execute(
+            select(models.Property.uid, models.Property.type))).all()
+        products = (await db.execute(
+            select(models.Product.uid, models.Product.name))).all()
+        product_properties = (await db.execute(
+            select(
+                models.ProductProperty.product_uid,
+                models.ProductProperty.property_uid,
+                models.ProductProperty.value_uid,
+                models.ProductProperty.value_int,
+            ))).all()
+
+        types = dict(properties)
+        self._reset()
+        self._types.update(types)
+
+        for product_id, (uid, name) in enumerate(products):
+            self._ids[uid] = product_id
+            self._uids.append(uid)
+            self._names.append(name)
+            self._product_values[product_id] = []
+        size = len(self._uids)
+
+        list_ids = {}
+        for row in product_properties:
+            product_id = self._ids.get(row.product_uid)
+            if product_id is None:
+                continue
+            if types.get(row.property_uid) == "list":
+                if row.value_uid is None:
+                    continue
+                value = row.value_uid
+                list_ids.setdefault((row.property_uid, value), []).append(product_id)
+            else:
+                if row.value_int is None:
+                    continue
+                value = row.value_int
+                self._columns.setdefault(row.property_uid, []).append((value, product_id))
+            self._product_values[product_id].append((row.property_uid, value))
+
+        self._bitmaps = {key: from_ids(ids, size) for key, ids in list_ids.items()}
+        for column in self._columns.values():
+            column.sort()
+        self._alive = from_ids(range(size), size)
+        self._by_uid = sorted((uid, product_id) for product_id, uid in enumerate(self._uids))
+        self._by_name = sorted(
+            (*name_key(self._names[product_id]), uid, product_id) for product_id, uid in enumerate(self._uids))
+        self.ready = True
+
+    async def refresh_properties(self, db: AsyncSession, uids: Iterable[str]):
+        """Перечитать типы свойств uids: новые добавить, удаленные убрать."""
+        uids = list(uids)
+        types = dict((await db.execute(
+            select(models.Property.uid, models.Property.type).where(models.Property.uid.in_(uids)))).all())
+        for uid in uids:
+            if uid in types:
+                self.set_property(uid, types[uid])
+            else:
+                self.remove_property(uid)
+
+    async def refresh_products(self, db: AsyncSession, uids: Iterable[str]):
+        """Перечитать товары uids: измененные заменить, удаленные убрать."""
+        uids = list(uids)
+        pp = models.ProductProperty
+        names = dict((await db.execute(
+            select(models.Product.uid, models.Product.name).where(models.Product.uid.in_(uids)))).all())
+        rows = (await db.execute(
+            select(pp.product_uid, pp.property_uid, pp.value_uid, pp.value_int)
+            .where(pp.product_uid.in_(uids)).order_by(pp.product_uid, pp.id))).all()
+
+        values = {}
+        for row in rows:
+            value = row.value_uid if self._types.get(row.property_uid) == "list" else row.value_int
+            values.setdefault(row.product_uid, []).append((row.property_uid, value))
+        for uid in uids:
+            if uid in names:
+                self.add_product(uid, names[uid], values.get(uid, []))
+            else:
+                self.remove_product(uid)
+
+    def set_property(self, property_uid: str, type_: str):
+        self._types[property_uid] = type_
+
+    def remove_property(self, property_uid: str):
+        self._types.pop(property_uid, None)
+        self._columns.pop(property_uid, None)
+        for key in [key for key in self._bitmaps if key[0] == property_uid]:
+            del self._bitmaps[key]
+
+    def add_product(self, uid: str, name: Optional[str], values: Iterable[Tuple[str, object]]):
+        """Добавить или заменить товар. values - пары (property_uid, value_uid для list / число для int).
+
+        Товар сохраняет свой id, новый берет id удаленного товара, если такой есть,
+        поэтому ширина карт растет с размером каталога, а не с числом записей.
+        """
+        if uid in self._ids:
+            product_id = self._ids[uid]
+            self._unlink(product_id)
+        elif self._free:
+            product_id = self._free.pop()
+        else:
+            product_id = len(self._uids)
+            self._uids.append(None)
+            self._names.append(None)
+
+        bit = 1 << product_id
+        self._ids[uid] = product_id
+        self._uids[product_id] = uid
+        self._names[product_id] = name
+        self._alive |= bit
+        insort(self._by_uid, (uid, product_id))
+        insort(self._by_name, (*name_key(name), uid, product_id))
+
+        stored = []
+        for property_uid, value in values:
+            if value is None:
+                continue
+            if self._types.get(property_uid) == "list":
+                key = (property_uid, value)
+                self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+            else:
+                value = int(value)
+                insort(self._columns.setdefault(property_uid, []), (value, product_id))
+            stored.append((property_uid, value))
+        self._product_values[product_id] = stored
+
+    def remove_product(self, uid: str):
+        product_id = self._ids.pop(uid, None)
+        if product_id is None:
+            return
+
+        self._unlink(product_id)
+        self._free.append(product_id)
+        if len(self._free) > max(COMPACT_MIN_FREE, len(self._uids) // 2):
+            self._compact()
+
+    def _unlink(self, product_id: int):
+        """Убрать товар product_id из карт, колонок и сортировок; id остается за вызывающим."""
+        uid = self._uids[product_id]
+        bit = 1 << product_id
+        self._alive &= ~bit
+        for property_uid, value in self._product_values.pop(product_id, []):
+            key = (property_uid, value)
+            if key in self._bitmaps:
+                self._bitmaps[key] &= ~bit
+            column = self._columns.get(property_uid)
+            if column:
+                pos = bisect_left(column, (value, product_id))
+                if pos < len(column) and column[pos] == (value, product_id):
+                    del column[pos]
+
+        name = self._names[product_id]
+        del self._by_uid[bisect_left(self._by_uid, (uid, product_id))]
+        del self._by_name[bisect_left(self._by_name, (*name_key(name), uid, product_id))]
+
+    def _compact(self):
+        """Перенумеровать товары подряд, когда удаленных id больше половины."""
+        old_ids = sorted(self._ids.values())
+        new_ids = {old: new for new, old in enumerate(old_ids)}
+        size = len(old_ids)
+
+        self._uids = [self._uids[old] for old in old_ids]
+        self._names = [self._names[old] for old in old_ids]
+        self._ids = {uid: product_id for product_id, uid in enumerate(self._uids)}
+        self._free = []
+        self._product_values = {new_ids[old]: values for old, values in self._product_values.items()}
+        self._bitmaps = {
+            key: from_ids((new_ids[old] for old in iter_bits(bitmap)), size)
+            for key, bitmap in self._bitmaps.items()
+        }
+        self._columns = {
+            property_uid: sorted((value, new_ids[old]) for value, old in column)
+            for property_uid, column in self._columns.items()
+        }
+        self._alive = from_ids(range(size), size)
+        self._by_uid = sorted((uid, product_id) for product_id, uid in enumerate(self._uids))
+        self._by_name = sorted(
+            (*name_key(self._names[product_id]), uid, product_id) for product_id, uid in enumerate(self._uids))
+
+    def match(self, name: str = None, filters: dict = None) -> int:
+        """Вернуть битовую карту товаров, подходящих под фильтр."""
+        result = self._alive
+
+        if filters:
+            for prop_uid, values in filters.items():
+                if isinstance(values, dict):  # range filter for int
+                    column = self._columns.get(prop_uid, [])
+                    lo = bisect_left(column, (values["from"], -1)) if "from" in values else 0
+                    hi = bisect_right(column, (values["to"], len(self._uids))) if "to" in values else len(column)
+                    bitmap = from_ids((product_id for _, product_id in column[lo:hi]), len(self._uids))
+                else:  # list of values for list property
+                    bitmap = 0
+                    for value in values:
+                        bitmap |= self._bitmaps.get((prop_uid, value), 0)
+                result &= bitmap
+                if not result:
+                    return 0
+
+        if name:
+            needle = name.lower()
+            result = from_ids(
+                (product_id for product_id in iter_bits(result) if needle in (self._names[product_id] or "").lower()),
+                len(self._uids))
+
+        return result
+
+    def page(self, bitmap: int, sort: str = "uid", skip: int = 0, limit: int = 10,
+             after: tuple = None) -> List[str]:
+        """Вернуть uid товаров страницы в порядке сортировки.
+
+        after - ключ сортировки последнего товара предыдущей страницы (курсор).
+        """
+        uids = []
+        bits = to_bytes(bitmap)
+        ordered = self._by_name if sort == "name" else self._by_uid
+        start = 0
+        if after is not None:
+            if sort == "name":
+                after = (*name_key(after[0]), after[1])
+            start = bisect_right(ordered, (*after, len(self._uids)))
+            skip = 0
+        for pos in range(start, len(ordered)):
+            entry = ordered[pos]
+            if not has_bit(bits, entry[-1]):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            uids.append(self._uids[entry[-1]])
+            if len(uids) >= limit:
+                break
+        return uids
+
+    def facets(self, bitmap: int):
+        """Посчитать фасеты по битовой карте: (count, value_counts, ranges)."""
+        value_counts = {
+            key: (values & bitmap).bit_count()
+            for key, values in self._bitmaps.items()
+        }
+
+        ranges = {}
+        bits = to_bytes(bitmap)
+        for property_uid, column in self._columns.items():
+            min_val = next((v for v, product_id in column if has_bit(bits, product_id)), None)
+            max_val = next((v for v, product_id in reversed(column) if has_bit(bits, product_id)), None)
+            if min_val is not None:
+                ranges[property_uid] = (min_val, max_val)
+
+        return bitmap.bit_count(), value_counts, ranges
+
+
+def name_key(name: Optional[str]) -> tuple:
+    """Ключ сортировки по имени как ORDER BY name в базе: NULL после всех имен."""
+    return name is None, name or ""
+
+
+def to_bytes(bitmap: int) -> bytes:
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+
+def from_ids(ids: Iterable[int], size: int) -> int:
+    buf = bytearray((size + 7) // 8)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def has_bit(bits: bytes, i: int) -> bool:
+    byte = i >> 3
+    return byte < len(bits) and bool(bits[byte] >> (i & 7) & 1)
+
+
+def iter_bits(bitmap: int):
+    for byte_no, byte in enumerate(to_bytes(bitmap)):
+        while byte:
+            low = byte & -byte
+            yield (byte_no << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+facet_index = FacetIndex()
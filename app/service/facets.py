@@ -0,0 +1,111 @@
+from sqlalchemy import String, cast, func, literal_column, null, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from service import counters
+from service.filters import apply_product_filters, set_similarity_threshold
+from service.planner import filter_stats
+from service.registry import property_registry
+from tables import models
+
+
+def build_facet_query(name: str = None, filters: dict = None, min_similarity: float = None,
+                      page: tuple = None):
+    """Собрать один запрос, который считает все фасеты по отфильтрованным товарам.
+
+    Отфильтрованные товары остаются в базе в виде CTE. Первая строка результата
+    (property_uid IS NULL) содержит общее количество товаров, остальные -
+    количество товаров по каждой паре (свойство, значение) и min/max для int свойств.
+    page - (sort, skip, limit): тогда в первой строке есть колонка page, uid
+    товаров страницы из того же CTE в порядке /catalog/.
+    """
+    columns = [models.Product.uid]
+    if page is not None:
+        columns.append(models.Product.name)
+    filtered = apply_product_filters(
+        select(*columns), name=name, filters=filters,
+        min_similarity=min_similarity).cte("filtered_products")
+
+    total_columns = [
+        null().label("property_uid"),
+        null().label("value_uid"),
+        func.count().label("count"),
+        null().label("min_value"),
+        null().label("max_value"),
+    ]
+    if page is not None:
+        total_columns.append(page_uids(filtered, name, min_similarity, *page).label("page"))
+    total_query = select(*total_columns).select_from(filtered)
+
+    pp = models.ProductProperty
+    groups_query = (
+        select(
+            pp.property_uid,
+            pp.value_uid,
+            func.count().label("count"),
+            func.min(pp.value_int).label("min_value"),
+            func.max(pp.value_int).label("max_value"),
+        )
+        .join(filtered, pp.product_uid == filtered.c.uid)
+        .group_by(pp.property_uid, pp.value_uid)
+    )
+    if page is not None:
+        groups_query = groups_query.add_columns(cast(null(), ARRAY(String)))
+
+    return union_all(total_query, groups_query)
+
+
+def page_uids(filtered, name: str, min_similarity: float, sort: str, skip: int, limit: int):
+    """Подзапрос: массив uid страницы из CTE отфильтрованных товаров."""
+    if name and min_similarity is not None:
+        order = (func.similarity(filtered.c.name, name).desc(), filtered.c.uid)
+    elif sort == "name":
+        order = (filtered.c.name, filtered.c.uid)
+    else:
+        order = (filtered.c.uid,)
+    position = func.row_number().over(order_by=order).label("position")
+    rows = select(filtered.c.uid, position).order_by(*order).offset(skip).limit(limit).subquery("page")
+    return (
+        select(func.coalesce(func.array_agg(aggregate_order_by(rows.c.uid, rows.c.position)),
+                             cast(literal_column("'{}'"), ARRAY(String))))
+        .scalar_subquery()
+    )
+
+
+def build_filter_response(count: int, properties, value_counts: dict, ranges: dict) -> dict:
+    properties_data = {}
+
+    for prop in properties:
+        if prop.type == "list":
+            properties_data[prop.uid] = {
+                value_uid: value_counts.get((prop.uid, value_uid), 0)
+                for value_uid in prop.value_uids
+            }
+        else:
+            min_val, max_val = ranges.get(prop.uid, (None, None))
+            properties_data[prop.uid] = {
+                "min_value": min_val,
+                "max_value": max_val
+            }
+
+    return {
+        "count": count,
+        "properties": properties_data
+    }
+
+
+async def compute_facets(db: AsyncSession, name: str = None, filters: dict = None,
+                         min_similarity: float = None) -> dict:
+    if name and min_similarity is not None:
+        await set_similarity_threshold(db, min_similarity)
+    if filters:
+        await filter_stats.ensure_loaded(db)
+
+    facet_rows = (await db.execute(
+        build_facet_query(name=name, filters=filters, min_similarity=min_similarity))).all()
+    count, value_counts, ranges = counters.parse_facet_rows(facet_rows)
+
+    await property_registry.ensure_loaded(db)
+
+    return build_filter_response(count, property_registry.all(), value_counts, ranges)
@@ -0,0 +1,55 @@
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from core.config import settings
+from service.documents import split_filters
+from service.planner import compile_filters
+from tables import models
+
+
+def apply_product_filters(query, name: str = None, filters: dict = None, min_similarity: float = None):
+    """Добавить в запрос по товарам условия по имени и свойствам.
+
+    Если задан min_similarity, имя ищется по триграммам (name % :name), порог
+    нужно предварительно выставить через set_similarity_threshold. Порядок условий
+    по свойствам берется из planner.filter_stats, ее нужно загрузить заранее.
+    """
+    if name and min_similarity is not None:
+        query = query.where(models.Product.name.op("%")(name))
+    elif name:
+        query = query.where(models.Product.name.ilike(f"%{name}%"))
+
+    if filters and settings.PRODUCT_DOCUMENTS:
+        # list filters as containment on products.document, ranges stay on product_properties
+        condition, filters = split_filters(filters)
+        if condition is not None:
+            query = query.where(condition)
+
+    if filters:
+        # one subquery for the whole filter set, see planner.compile_filters
+        query = query.where(models.Product.uid.in_(compile_filters(filters)))
+
+    return query
+
+
+def filter_signature(name: str = None, filters: dict = None, min_similarity: float = None) -> tuple:
+    """Канонический ключ фильтра: не зависит от порядка параметров и значений в запросе."""
+    conditions = []
+    for prop_uid, values in sorted((filters or {}).items()):
+        if isinstance(values, dict):
+            conditions.append((prop_uid, "range", values.get("from"), values.get("to")))
+        else:
+            conditions.append((prop_uid, "in", tuple(sorted(set(values)))))
+
+    name = name or None
+    return name, min_similarity if name else None, tuple(conditions)
+
+
+async def set_similarity_threshold(db: AsyncSession, threshold: float):
+    """Выставить порог pg_trgm для оператора % до конца текущей транзакции."""
+    await db.execute(select(func.set_config("pg_trgm.similarity_threshold", str(threshold), True)))
+
+
+def similarity_rank(name: str):
+    return func.similarity(models.Product.name, name).desc()
@@ -0,0 +1,277 @@
+import asyncio
+import codecs
+import json
+import time
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from service import counters, documents, events
+from service.cache import catalog_generation
+from service.crud import INT_VALUE_MAX, INT_VALUE_MIN, parse_int_value
+from service.facet_index import facet_index
+from service.registry import property_registry
+from tables import models
+
+JSON_WHITESPACE = " \t\n\r"
+
+
+class AsyncFile:
+    """Обертка над обычным файлом: чтение в пуле потоков, чтобы не блокировать event loop."""
+
+    def __init__(self, file):
+        self.file = file
+
+    async def read(self, size: int = -1):
+        return await asyncio.to_thread(self.file.read, size)
+
+    async def seek(self, offset: int):
+        return await asyncio.to_thread(self.file.seek, offset)
+
+
+class JsonArrayStream:
+    """Потоковое чтение массива верхнего уровня из дампа вида {"key": [...], ...}.
+
+    Элементы массива разбираются по одному через JSONDecoder.raw_decode, в памяти
+    держится только текущий кусок файла. Массивы других ключей пропускаются
+    поэлементно.
+    """
+
+    def __init__(self, read, chunk_size: int = 1 << 16):
+        self._read = read
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    async def _fill(self) -> bool:
+        if self._eof:
+            return False
+
+        chunk = await self._read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if isinstance(chunk, bytes):
+            # may be empty if the chunk ends inside a multi-byte character
+            chunk = self._utf8.decode(chunk)
+
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    async def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in JSON_WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not await self._fill():
+                raise ValueError("unexpected end of JSON")
+
+    async def _expect(self, char: str):
+        found = await self._peek()
+        if found != char:
+            raise ValueError(f"expected {char!r}, got {found!r}")
+        self._pos += 1
+
+    async def _value(self):
+        await self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not await self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and await self._fill():
+                continue
+            self._pos = end
+            return value
+
+    async def _items(self):
+        await self._expect("[")
+        if await self._peek() == "]":
+            self._pos += 1
+            return
+
+        while True:
+            yield await self._value()
+            separator = await self._peek()
+            self._pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or ']', got {separator!r}")
+
+    async def iter_array(self, key: str):
+        await self._expect("{")
+        if await self._peek() == "}":
+            return
+
+        while True:
+            name = await self._value()
+            await self._expect(":")
+            if name == key:
+                async for item in self._items():
+                    yield item
+                return
+            if await self._peek() == "[":
+                async for _ in self._items():
+                    pass
+            else:
+                await self._value()
+
+            separator = await self._peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or '}}', got {separator!r}")
+
+
+def property_values_json(prop_data: dict):
+    if prop_data.get("values"):
+        return [{'value': item['value']} for item in prop_data["values"]]
+    return prop_data.get("value")
+
+
+async def copy_records(db: AsyncSession, table: str, columns: list, records: list):
+    """Записать строки через COPY в соединении текущей транзакции сессии."""
+    if not records:
+        return
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table, records=records, columns=columns)
+
+
+class DumpError(ValueError):
+    """Ошибка в данных дампа, найденная до записи в базу."""
+
+
+async def read_properties(source) -> tuple:
+    """Свойства дампа: (строки properties, строки property_values, uid -> тип)."""
+    properties = []
+    values = []
+    property_types = {}
+
+    async for prop_data in JsonArrayStream(source.read).iter_array("properties"):
+        property_types[prop_data["uid"]] = prop_data["type"]
+        properties.append({
+            "uid": prop_data["uid"],
+            "name": prop_data["name"],
+            "type": prop_data["type"],
+            "values": property_values_json(prop_data),
+        })
+        for position, item in enumerate(prop_data.get("values") or []):
+            values.append({
+                "uid": item["uid"],
+                "property_uid": prop_data["uid"],
+                "value": item["value"],
+                "position": position,
+            })
+    return properties, values, property_types
+
+
+async def validate_products(source, property_types: dict):
+    """Проверить товары дампа до записи: int значения по тем же правилам, что и в API.
+
+    Пачки товаров коммитятся по одной, поэтому ошибка, найденная при записи,
+    оставила бы каталог загруженным частично.
+    """
+    async for product_data in JsonArrayStream(source.read).iter_array("products"):
+        for prop_data in product_data.get("properties", []):
+            if property_types.get(prop_data["uid"]) == "list":
+                continue
+            value = prop_data.get("value")
+            if value is not None and parse_int_value(value) is None:
+                raise DumpError(
+                    f"product {product_data['uid']}: property {prop_data['uid']} requires integer value "
+                    f"between {INT_VALUE_MIN} and {INT_VALUE_MAX}, got {value!r}")
+
+
+async def import_properties(db: AsyncSession, properties: list, values: list, property_types: dict):
+    if properties:
+        await db.execute(insert(models.Property).values(properties).on_conflict_do_nothing())
+    if values:
+        await db.execute(insert(models.PropertyValue).values(values).on_conflict_do_nothing())
+    await events.publish(db, "properties", property_types)
+    await db.commit()
+    property_registry.bump()
+    catalog_generation.bump()
+
+
+async def import_catalog(db: AsyncSession, source, chunk_size: int = None) -> dict:
+    """Загрузить дамп каталога потоково.
+
+    source - объект с async read(size) и seek(offset) (AsyncFile, UploadFile).
+    Первый проход читает свойства, второй проверяет товары (DumpError до
+    любой записи), третий пишет свойства и товары: товары через COPY с
+    коммитом пачками по chunk_size товаров.
+
+    Импорт дописывает товары и рассчитан на пустой каталог: товар с уже
+    существующим uid прерывает COPY. Ошибка базы на середине оставляет
+    записанные пачки; повторить импорт можно после TRUNCATE products CASCADE
+    и rebuild-counters (см. README).
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    started = time.perf_counter()
+
+    properties, values, property_types = await read_properties(source)
+    await source.seek(0)
+    await validate_products(source, property_types)
+    await source.seek(0)
+    await import_properties(db, properties, values, property_types)
+
+    stats = {"properties": len(property_types), "products": 0, "product_properties": 0}
+    products = []
+    product_properties = []
+
+    async def flush(last: bool = False):
+        await copy_records(db, "products", ["uid", "name", "document"], products)
+        await copy_records(
+            db, "product_properties",
+            ["product_uid", "property_uid", "value_uid", "value_int"], product_properties)
+        await counters.apply_deltas(
+            db, added=[row[1:] for row in product_properties], products=len(products))
+        if products or last:
+            await events.publish(db, "products", [row[0] for row in products], sticky=last)
+        await db.commit()
+        catalog_generation.bump()
+        stats["products"] += len(products)
+        stats["product_properties"] += len(product_properties)
+        products.clear()
+        product_properties.clear()
+
+    async for product_data in JsonArrayStream(source.read).iter_array("products"):
+        first_property = len(product_properties)
+        for prop_data in product_data.get("properties", []):
+            if property_types.get(prop_data["uid"]) == "list":
+                product_properties.append(
+                    (product_data["uid"], prop_data["uid"], prop_data.get("value_uid"), None))
+            else:
+                value = prop_data.get("value")
+                value_int = parse_int_value(value) if value is not None else None
+                product_properties.append((product_data["uid"], prop_data["uid"], None, value_int))
+
+        document = documents.build_document(row[1:] for row in product_properties[first_property:])
+        products.append((product_data["uid"], product_data.get("name"), json.dumps(document, ensure_ascii=False)))
+
+        if len(products) >= chunk_size:
+            await flush()
+
+    await flush(last=True)
+
+    if settings.CATALOG_BACKEND == "index":
+        await facet_index.build(db)
+
+    seconds = time.perf_counter() - started
+    rows = stats["products"] + stats["product_properties"]
+    stats["seconds"] = round(seconds, 3)
+    stats["rows_per_second"] = round(rows / seconds) if seconds else rows
+    return stats
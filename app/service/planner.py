@@ -0,0 +1,136 @@
+import json
+import time
+
+from sqlalchemy import and_, distinct, func, intersect, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.future import select
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from core.config import settings
+from service import counters
+from tables import models
+
+
+class FilterStats:
+    """Оценки кардинальности фильтров по таблицам счетчиков фасетов.
+
+    Копия счетчиков держится в памяти и перечитывается не чаще раза в
+    PLANNER_STATS_TTL секунд: для выбора порядка условий точность не нужна.
+    """
+
+    def __init__(self):
+        self.loaded_at = None
+        self.total = 0
+        self.value_counts = {}  # (property uid, value uid) -> products
+        self.ranges = {}        # property uid -> (min, max)
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > settings.PLANNER_STATS_TTL:
+            await self.load(db)
+
+    async def load(self, db: AsyncSession):
+        self.total, self.value_counts, self.ranges = await counters.read_facets(db)
+        self.loaded_at = time.monotonic()
+
+    def estimate(self, prop_uid: str, values) -> float:
+        """Ожидаемое число товаров под условием по одному свойству; без статистики - inf."""
+        if self.loaded_at is None:
+            return float("inf")
+
+        if not isinstance(values, dict):
+            return sum(self.value_counts.get((prop_uid, value), 0) for value in set(values))
+
+        low, high = self.ranges.get(prop_uid, (None, None))
+        if low is None or high is None:
+            return 0
+        # uniform distribution between min and max
+        start, end = max(values.get("from", low), low), min(values.get("to", high), high)
+        if start > end:
+            return 0
+        return self.total * (end - start + 1) / (high - low + 1)
+
+
+filter_stats = FilterStats()
+
+
+def plan_filters(filters: dict) -> list:
+    """Условия фильтра в порядке возрастания оценки, самые селективные первыми."""
+    return sorted(filters.items(), key=lambda item: filter_stats.estimate(*item))
+
+
+def property_condition(prop_uid: str, values):
+    pp = models.ProductProperty
+    if isinstance(values, dict):  # range filter for int
+        condition = [pp.property_uid == prop_uid]
+        if "from" in values:
+            condition.append(pp.value_int >= values["from"])
+        if "to" in values:
+            condition.append(pp.value_int <= values["to"])
+        return and_(*condition)
+    return and_(pp.property_uid == prop_uid, pp.value_uid.in_(values))
+
+
+def choose_strategy(planned: list) -> str:
+    """auto: проверять остальные условия по товарам самого селективного, если это дешевле INTERSECT.
+
+    Проверка читает все строки product_properties каждого товара из ведущего
+    множества, INTERSECT - все строки каждого условия.
+    """
+    estimates = [filter_stats.estimate(*item) for item in planned]
+    if estimates[0] == float("inf"):
+        return "intersect"
+    return "having" if estimates[0] * len(planned) <= sum(estimates[1:]) else "intersect"
+
+
+def compile_filters(filters: dict, strategy: str = None):
+    """Собрать фильтр по свойствам в один подзапрос uid товаров.
+
+    intersect - INTERSECT множеств товаров по каждому свойству, самое
+    селективное первым; having - ведущее множество по самому селективному
+    условию, остальные проверяются одним проходом по его строкам с
+    GROUP BY product_uid HAVING count(DISTINCT property_uid) = n - 1;
+    auto - выбор между ними по оценкам filter_stats.
+    """
+    strategy = strategy or settings.FILTER_PLAN
+    planned = plan_filters(filters)
+    pp = models.ProductProperty
+
+    if len(planned) == 1:
+        return select(pp.product_uid).where(property_condition(*planned[0]))
+
+    if strategy == "auto":
+        strategy = choose_strategy(planned)
+
+    if strategy == "having":
+        driver = select(pp.product_uid).where(property_condition(*planned[0]))
+        return (
+            select(pp.product_uid)
+            .where(pp.product_uid.in_(driver), or_(*(property_condition(*item) for item in planned[1:])))
+            .group_by(pp.product_uid)
+            .having(func.count(distinct(pp.property_uid)) == len(planned) - 1)
+        )
+
+    return intersect(*(select(pp.product_uid).where(property_condition(*item)) for item in planned))
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) для запроса с обычными bind параметрами."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+async def explain_rows(db: AsyncSession, query) -> int:
+    """Оценка планировщика Postgres числа строк запроса, без его выполнения."""
+    plan = (await db.execute(Explain(query))).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,116 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from core.config import settings
+from service.cache import catalog_version
+from tables import models
+
+
+@dataclass(frozen=True)
+class PropertyInfo:
+    uid: str
+    name: str
+    type: str
+    values: Any               # properties.values как есть, уходит в ответы
+    value_uids: Tuple[str, ...]  # uid значений list свойства по position
+    value_texts: Tuple[str, ...] = ()  # тексты тех же значений
+
+
+class PropertyRegistry:
+    """Все свойства каталога в памяти процесса.
+
+    Таблица properties маленькая и меняется редко, поэтому она читается целиком
+    одним запросом и перечитывается только после bump() - его вызывают
+    create_property / delete_property и загрузчик.
+
+    Неизвестный uid (свойство создано в другом процессе или его нет вовсе)
+    перечитывает реестр, только если версия каталога изменилась с прошлой
+    загрузки, и не чаще раза в REGISTRY_RELOAD_INTERVAL: запросы с выдуманными
+    uid не перечитывают таблицу на каждый вызов.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._loaded_version = -1
+        self._loaded_catalog = None  # catalog_version.value at the last load
+        self._reloaded_at = None     # monotonic time of the last reload for unknown uids
+        self._properties: Dict[str, PropertyInfo] = {}
+        self._value_owners: Dict[str, str] = {}
+        self._value_texts: Dict[str, str] = {}
+
+    def bump(self):
+        self.version += 1
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self._loaded_version != self.version:
+            await self.load(db)
+
+    async def ensure_known(self, db: AsyncSession, property_uids: Iterable[str]):
+        """Перечитать свойства, если среди uid есть неизвестные (созданы в другом процессе)."""
+        await self.ensure_loaded(db)
+        if all(uid in self._properties for uid in property_uids):
+            return
+        # without the bus the version does not see other workers, only the interval is left
+        changed = (catalog_version.value is None or catalog_version.value != self._loaded_catalog
+                   or not settings.INVALIDATION_BUS)
+        now = time.monotonic()
+        if not changed or (self._reloaded_at is not None
+                           and now - self._reloaded_at < settings.REGISTRY_RELOAD_INTERVAL):
+            return
+        self._reloaded_at = now
+        self.bump()
+        await self.load(db)
+
+    async def load(self, db: AsyncSession):
+        version = self.version
+        # taken before the query: a write during the load changes it and allows a reload
+        self._loaded_catalog = catalog_version.value
+        result = await db.execute(
+            select(models.Property).options(selectinload(models.Property.value_items)))
+
+        self.replace([
+            PropertyInfo(
+                uid=prop.uid,
+                name=prop.name,
+                type=prop.type,
+                values=prop.values,
+                value_uids=tuple(value.uid for value in prop.value_items),
+                value_texts=tuple(value.value for value in prop.value_items),
+            )
+            for prop in result.scalars().all()
+        ], version)
+
+    def replace(self, properties: Iterable[PropertyInfo], version: int = None):
+        self._properties = {prop.uid: prop for prop in properties}
+        self._value_owners = {
+            value_uid: prop.uid
+            for prop in self._properties.values() for value_uid in prop.value_uids
+        }
+        self._value_texts = {
+            value_uid: text
+            for prop in self._properties.values() for value_uid, text in zip(prop.value_uids, prop.value_texts)
+        }
+        self._loaded_version = self.version if version is None else version
+
+    def get(self, property_uid: str) -> Optional[PropertyInfo]:
+        return self._properties.get(property_uid)
+
+    def all(self):
+        return list(self._properties.values())
+
+    def types(self) -> Dict[str, str]:
+        return {uid: prop.type for uid, prop in self._properties.items()}
+
+    def value_owner(self, value_uid: str) -> Optional[str]:
+        return self._value_owners.get(value_uid)
+
+    def value_text(self, value_uid: str) -> Optional[str]:
+        return self._value_texts.get(value_uid)
+
+
+property_registry = PropertyRegistry()
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, JSON
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship, declarative_base
 
 from tables import Base
 
@@ -12,22 +13,98 @@ class Property(Base):
     type = Column(String)
     values = Column(JSON, nullable=True)
 
+    value_items = relationship(
+        "PropertyValue",
+        order_by="PropertyValue.position",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+
+class PropertyValue(Base):
+    __tablename__ = "property_values"
+
+    uid = Column(String, primary_key=True)
+    property_uid = Column(String, ForeignKey("properties.uid", ondelete="CASCADE"), index=True)
+    value = Column(String)
+    position = Column(Integer)
+
 
 class Product(Base):
     __tablename__ = "products"
 
     uid = Column(String, primary_key=True, index=True)
     name = Column(String, index=True)
+    # свойства товара одним массивом, см. service/documents.py; ORM не читает его без запроса
+    document = deferred(Column(JSONB, nullable=True))
+
+    properties = relationship("ProductProperty", back_populates="product", cascade="all, delete-orphan")
 
-    properties = relationship("ProductProperty", back_populates="product")
+    __table_args__ = (
+        Index("ix_products_name_uid", "name", "uid"),  # keyset pagination by name
+        Index(
+            "ix_products_name_trgm", "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),  # ILIKE '%...%' and similarity search
+        Index(
+            "ix_products_document", "document",
+            postgresql_using="gin",
+            postgresql_ops={"document": "jsonb_path_ops"},
+        ),  # document @> containment filters
+    )
 
 
 class ProductProperty(Base):
     __tablename__ = "product_properties"
 
     id = Column(Integer, primary_key=True, index=True)
-    product_uid = Column(String, ForeignKey("products.uid"))
+    product_uid = Column(String, ForeignKey("products.uid"), index=True)
     property_uid = Column(String, ForeignKey("properties.uid"))
+    value_uid = Column(String, ForeignKey("property_values.uid"), nullable=True)  # list properties
+    value_int = Column(Integer, nullable=True)  # int properties
 
     product = relationship("Product", back_populates="properties")
-    property = relationship("Property")
\ No newline at end of file
+    property = relationship("Property")
+    property_value = relationship("PropertyValue")
+
+    __table_args__ = (
+        # covering indexes for list and range filters and the int min/max recompute (index-only scans)
+        Index("ix_product_properties_property_value_uid", "property_uid", "value_uid", "product_uid"),
+        Index("ix_product_properties_property_value_int", "property_uid", "value_int", "product_uid"),
+    )
+
+
+class FacetValueCount(Base):
+    """Количество строк product_properties по паре (свойство, значение) для list свойств."""
+    __tablename__ = "facet_value_counts"
+
+    property_uid = Column(String, ForeignKey("properties.uid", ondelete="CASCADE"), primary_key=True)
+    value_uid = Column(String, ForeignKey("property_values.uid", ondelete="CASCADE"), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+
+
+class FacetIntRange(Base):
+    """min/max значения int свойства по всему каталогу."""
+    __tablename__ = "facet_int_ranges"
+
+    property_uid = Column(String, ForeignKey("properties.uid", ondelete="CASCADE"), primary_key=True)
+    min_value = Column(Integer, nullable=True)
+    max_value = Column(Integer, nullable=True)
+
+
+class CatalogCounter(Base):
+    """Именованные счетчики каталога, например общее количество товаров ('products')."""
+    __tablename__ = "catalog_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class CatalogState(Base):
+    """Версия каталога для ETag: одна строка id = 1, version растет с каждой записью."""
+    __tablename__ = "catalog_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,4 +1,6 @@
-from typing import Dict, List
+import base64
+import json
+from typing import Dict, List, Optional
 from fastapi import Request
 
 
@@ -39,4 +41,32 @@ def parse_int_property_ranges(request: Request) -> Dict[str, Dict[str, int]]:
 
             int_property_ranges[prop_uid][range_key] = int(value)
 
-    return int_property_ranges
\ No newline at end of file
+    return int_property_ranges
+
+
+def encode_cursor(sort: str, product) -> str:
+    key = [product.name, product.uid] if sort == "name" else [product.uid]
+    raw = json.dumps([sort, key], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Optional[tuple]:
+    """Разобрать курсор. Пустой курсор - начало каталога, None."""
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+    if cursor_sort != sort or not isinstance(key, list) or len(key) != (2 if sort == "name" else 1):
+        raise ValueError("cursor does not match sort")
+
+    # key is [uid] or [name, uid], the name of a product can be NULL
+    *names, uid = key
+    if not isinstance(uid, str) or not all(name is None or isinstance(name, str) for name in names):
+        raise ValueError("invalid cursor")
+
+    return tuple(key)
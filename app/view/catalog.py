@@ -1,86 +1,146 @@
-from fastapi import APIRouter, Depends, Query
-from typing import Optional, Dict, List, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 import schemas
-from db.db import get_db
-from service import crud
+from core.config import settings
+from db.db import get_read_db, read_session
+from responses import product_to_dict, respond
+from service import crud, export
+from service.registry import property_registry
+from utils import parse_property_filters, parse_int_property_ranges, encode_cursor, decode_cursor
 
 router = APIRouter()
 
 
-def parse_filters(params: Dict[str, Union[str, List[str]]]):
+def parse_filters(request: Request) -> dict:
     filters = {}
-    for key, value in params.items():
-        if key.startswith("property_"):
-            prop_uid = key[len("property_"):]
-
-            if prop_uid.endswith("_from"):
-                prop_uid = prop_uid[:-5]
-                if prop_uid not in filters:
-                    filters[prop_uid] = {}
-                filters[prop_uid]["from"] = int(value)
-            elif prop_uid.endswith("_to"):
-                prop_uid = prop_uid[:-3]
-                if prop_uid not in filters:
-                    filters[prop_uid] = {}
-                filters[prop_uid]["to"] = int(value)
-            else:
-                if prop_uid not in filters:
-                    filters[prop_uid] = []
-                if isinstance(value, list):
-                    filters[prop_uid].extend(value)
-                else:
-                    filters[prop_uid].append(value)
+    filters.update(parse_property_filters(request))
+    filters.update(parse_int_property_ranges(request))
     return filters
 
 
-@router.get("/", response_model=schemas.ProductListResponse)
+def get_min_similarity(name_match: str, min_similarity: Optional[float]) -> Optional[float]:
+    if name_match != "similarity":
+        return None
+    return min_similarity if min_similarity is not None else settings.NAME_SIMILARITY_THRESHOLD
+
+
+@router.get("/", response_model=schemas.ProductListResponse, response_model_exclude_unset=True)
 async def get_catalog(
+        request: Request,
         page: int = Query(1, ge=1),
         page_size: int = Query(10, ge=1, le=100),
         name: Optional[str] = None,
         sort: str = Query("uid", regex="^(uid|name)$"),
-        db: AsyncSession = Depends(get_db),
-        **params
+        cursor: Optional[str] = Query(None, description="Keyset pagination: empty for the first page, then next_cursor"),
+        name_match: str = Query("substring", regex="^(substring|similarity)$"),
+        min_similarity: Optional[float] = Query(None, ge=0, le=1),
+        count: str = Query("exact", regex="^(exact|estimate|none)$",
+                           description="exact: count(*), estimate: cached or planner estimate, none: only has_more"),
+        db: AsyncSession = Depends(get_read_db),
 ):
-    filters = parse_filters(params)
+    filters = parse_filters(request)
+    min_similarity = get_min_similarity(name_match, min_similarity)
+
+    if cursor is not None:
+        if min_similarity is not None and name:
+            raise HTTPException(status_code=400, detail="cursor is not supported with name_match=similarity")
+        try:
+            after = decode_cursor(cursor, sort)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    skip = (page) * page_size
+        products, total = await crud.get_products(
+            db, limit=page_size + 1, name=name, filters=filters, sort=sort, after=after, count=count)
+        next_cursor = encode_cursor(sort, products[page_size - 1]) if len(products) > page_size else None
+        products = products[:page_size]
+    else:
+        skip = (page - 1) * page_size
 
-    products, total = await crud.get_products(
-        db, skip=skip, limit=page_size, name=name, filters=filters, sort=sort)
+        # without the total, one extra row tells whether there is a next page
+        limit = page_size + 1 if count == "none" else page_size
+
+        products, total = await crud.get_products(
+            db, skip=skip, limit=limit, name=name, filters=filters, sort=sort,
+            min_similarity=min_similarity, count=count)
+        has_more = len(products) > page_size
+        products = products[:page_size]
 
     # Convert to response format
-    product_responses = []
-    for product in products:
-        properties = []
-        for prop in product.properties:
-            prop_data = {
-                "uid": prop.property_uid,
-                "name": prop.property.name,
-                "value": prop.property.values,
-            }
-            properties.append(prop_data)
-
-        product_responses.append({
-            "uid": product.uid,
-            "name": product.name,
-            "properties": properties
-        })
-
-    return {"products": product_responses, "count": total}
+    product_responses = [product_to_dict(product) for product in products]
+
+    if cursor is not None:
+        return respond({"products": product_responses, "count": total, "next_cursor": next_cursor})
+    if count == "none":
+        return respond({"products": product_responses, "count": None, "has_more": has_more})
+    return respond({"products": product_responses, "count": total})
 
 
 @router.get("/filter/", response_model=schemas.FilterResponse)
 async def get_filter_options(
+        request: Request,
+        name: Optional[str] = None,
+        name_match: str = Query("substring", regex="^(substring|similarity)$"),
+        min_similarity: Optional[float] = Query(None, ge=0, le=1),
+        db: AsyncSession = Depends(get_read_db),
+):
+    filters = parse_filters(request)
+    filter_data = await crud.get_filter_data(
+        db, name=name, filters=filters, min_similarity=get_min_similarity(name_match, min_similarity))
+
+    return respond({
+        "count": filter_data["count"],
+        "properties": filter_data["properties"]
+    })
+
+
+@router.get("/search/", response_model=schemas.CatalogSearchResponse)
+async def search_catalog(
+        request: Request,
+        page: int = Query(1, ge=1),
+        page_size: int = Query(10, ge=1, le=100),
         name: Optional[str] = None,
-        db: AsyncSession = Depends(get_db),
-        **params
+        sort: str = Query("uid", regex="^(uid|name)$"),
+        name_match: str = Query("substring", regex="^(substring|similarity)$"),
+        min_similarity: Optional[float] = Query(None, ge=0, le=1),
+        db: AsyncSession = Depends(get_read_db),
 ):
-    filters = parse_filters(params)
-    filter_data = await crud.get_filter_data(db, name=name, filters=filters)
+    """Товары, общее число и фасеты одним запросом: /catalog/ и /catalog/filter/ с теми же параметрами."""
+    filters = parse_filters(request)
+    skip = (page - 1) * page_size
+
+    products, filter_data = await crud.search_catalog(
+        db, skip=skip, limit=page_size, name=name, filters=filters, sort=sort,
+        min_similarity=get_min_similarity(name_match, min_similarity))
 
-    return {
+    return respond({
+        "products": [product_to_dict(product) for product in products],
         "count": filter_data["count"],
         "properties": filter_data["properties"]
-    }
\ No newline at end of file
+    })
+
+
+@router.get("/export/")
+async def export_catalog(
+        request: Request,
+        format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+        name: Optional[str] = None,
+):
+    """Выгрузить все товары (или отфильтрованные теми же property_*) потоком NDJSON или CSV."""
+    filters = parse_filters(request)
+
+    async def stream():
+        # the session lives as long as the response body, not the request handler
+        async with read_session() as db:
+            await property_registry.ensure_loaded(db)
+            batches = export.iter_product_batches(
+                db, name=name, filters=filters, batch_size=settings.EXPORT_BATCH_SIZE)
+            chunks = export.csv_chunks(batches) if format == "csv" else export.ndjson_chunks(batches)
+            async for chunk in chunks:
+                yield chunk
+
+    if format == "csv":
+        return StreamingResponse(stream(), media_type="text/csv; charset=utf-8",
+                                 headers={"Content-Disposition": 'attachment; filename="catalog.csv"'})
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,35 @@
+import asyncio
+import tempfile
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.db import get_db
+from service import importer
+
+router = APIRouter()
+
+
+@router.post("/")
+async def import_catalog(
+        request: Request,
+        chunk_size: Optional[int] = Query(None, ge=1),
+        db: AsyncSession = Depends(get_db),
+):
+    """Загрузить дамп каталога из тела запроса (curl --data-binary @dump.json).
+
+    Тело пишется во временный файл по кускам, затем разбирается потоково.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as dump:
+        async for chunk in request.stream():
+            await asyncio.to_thread(dump.write, chunk)
+
+        source = importer.AsyncFile(dump)
+        await source.seek(0)
+        try:
+            stats = await importer.import_catalog(db, source, chunk_size=chunk_size)
+        except importer.DumpError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return stats
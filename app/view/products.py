@@ -1,32 +1,33 @@
+from typing import List
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 import schemas
-from db.db import get_db
+from core.config import settings
+from db.db import get_db, get_read_db
+from responses import product_to_dict, property_uids, respond
 from service import crud
+from service.cache import product_cache
+from service.registry import property_registry
 
 router = APIRouter()
 
 
 @router.get("/{product_uid}", response_model=schemas.ProductResponse)
-async def get_product(product_uid: str, db: AsyncSession = Depends(get_db)):
+async def get_product(product_uid: str, db: AsyncSession = Depends(get_read_db)):
+    content = product_cache.get(product_uid)
+    if content is not None:
+        return respond(content)
+
+    generation = product_cache.generation
     product = await crud.get_product(db, product_uid)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    properties = []
-    for prop in product.properties:
-        prop_data = {
-            "uid": prop.property_uid,
-            "name": prop.property.name,
-            "value": prop.property.values,
-        }
-        properties.append(prop_data)
-
-    return {
-        "uid": product.uid,
-        "name": product.name,
-        "properties": properties
-    }
+    # the dict is cached, so the cache works with and without FAST_RESPONSES
+    content = product_to_dict(product)
+    product_cache.set(product_uid, content, tags=property_uids(product), generation=generation)
+    return respond(content)
 
 
 @router.post("/", response_model=schemas.ProductResponse)
@@ -36,26 +37,24 @@ async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depe
         raise HTTPException(status_code=400, detail="Product with this UID already exists")
 
     # Validate properties
-    for prop in product.properties:
-        property = await crud.get_property(db, prop.uid)
-        if not property:
-            raise HTTPException(status_code=400, detail=f"Property {prop.uid} not found")
-
-        # if property.type == "list":
-        #     if not prop.value_uid:
-        #         raise HTTPException(status_code=400, detail=f"Property {prop.uid} requires value_uid")
-        #
-        #     # Check if value exists in property values
-        #     if not any(v["uid"] == prop.value_uid for v in (property.values or [])):
-        #         raise HTTPException(status_code=400, detail=f"Value {prop.value_uid} not found in property {prop.uid}")
-        # else:
-        #     if prop.value is None:
-        #         raise HTTPException(status_code=400, detail=f"Property {prop.uid} requires numeric value")
+    await property_registry.ensure_known(db, {prop.uid for prop in product.properties})
+    error = crud.validate_product(product)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
     db_product = await crud.create_product(db, product)
 
     # Return the created product
-    return await get_product(db_product.uid, db)
+    return respond(product_to_dict(db_product))
+
+
+@router.post("/batch/", response_model=schemas.ProductBatchResponse)
+async def upsert_products(products: List[schemas.ProductCreate], db: AsyncSession = Depends(get_db)):
+    if len(products) > settings.PRODUCT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"Batch is limited to {settings.PRODUCT_BATCH_MAX_SIZE} products")
+
+    return await crud.upsert_products(db, products)
 
 
 @router.delete("/{product_uid}")
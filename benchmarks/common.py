@@ -0,0 +1,51 @@
+import statistics
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+from core.config import settings  # noqa: E402
+
+
+def get_dsn() -> str:
+    """DSN для asyncpg из настроек приложения (.env)."""
+    return settings.get_database_url().replace("postgresql+asyncpg://", "postgresql://")
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    pos = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[pos]
+
+
+def summarize(samples) -> dict:
+    """Сводка по замерам в секундах -> миллисекунды."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+async def measure(fn, repeat: int = 20, warmup: int = 3) -> list:
+    for _ in range(warmup):
+        await fn()
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def print_table(rows: list, columns: list):
+    widths = [max(len(str(c)), *(len(str(r.get(c, ""))) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(w) for c, w in zip(columns, widths)))
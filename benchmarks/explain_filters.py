@@ -0,0 +1,293 @@
+"""Проверка планов фильтра по нескольким свойствам через EXPLAIN на синтетическом каталоге.
+
+Каталог создается в отдельной схеме bench_filters базы из .env (таблицы
+копируются из public через LIKE), рабочие таблицы не затрагиваются. Для каждой
+стратегии planner.compile_filters печатается время выполнения и проверяется
+форма плана: один подзапрос по товарам, SetOp для intersect с самым
+селективным условием первым, агрегат с HAVING и ведущим индексным условием для
+having. Результат сверяется
+со старой схемой "одно IN на свойство". Отдельно проверяется keyset страница
+по имени: один диапазон индекса ix_products_name_uid без BitmapOr и Sort, и
+пересчет min/max int свойства после удаления: по одной записи индекса на край.
+Код выхода 1, если проверка не прошла.
+
+    python benchmarks/explain_filters.py --products 200000
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from common import print_table
+
+from core.config import settings  # noqa: E402
+from service import counters, crud, facets  # noqa: E402
+from service.filters import apply_product_filters  # noqa: E402
+from service.planner import (  # noqa: E402
+    choose_strategy, compile_filters, filter_stats, plan_filters, property_condition)
+from tables import models  # noqa: E402
+
+SCHEMA = "bench_filters"
+TABLES = ["properties", "property_values", "products", "product_properties",
+          "facet_value_counts", "facet_int_ranges", "catalog_counters"]
+# list properties by number of values: the more values, the more selective one value is
+LIST_SIZES = [2, 4, 10, 50, 200, 1000]
+INT_MAX = 10000
+
+
+async def prepare(db: AsyncSession, products: int):
+    await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+    for table in TABLES:
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA}.{table} (LIKE public.{table} INCLUDING INDEXES)"))
+
+    # every 50th product has no name, for the NULL tail of the keyset by name
+    if tuple((await db.execute(text("SELECT count(*), count(name) FROM products"))).first()) == (
+            products, products - products // 50):
+        return
+
+    await db.execute(text("TRUNCATE " + ", ".join(TABLES)))
+    await db.execute(text("SELECT setseed(0.42)"))
+    await db.execute(text(
+        "INSERT INTO products (uid, name) "
+        "SELECT 'p' || lpad(g::text, 8, '0'), CASE WHEN g % 50 <> 0 THEN 'Товар ' || g END "
+        "FROM generate_series(1, :n) AS g"
+    ), {"n": products})
+
+    for index, size in enumerate(LIST_SIZES):
+        prop_uid = f"list-{size}"
+        await db.execute(text(
+            "INSERT INTO properties (uid, name, type) VALUES (:uid, :uid, 'list')"), {"uid": prop_uid})
+        await db.execute(text(
+            "INSERT INTO property_values (uid, property_uid, value, position) "
+            "SELECT CAST(:uid AS varchar) || '-' || v, :uid, 'Значение ' || v, v FROM generate_series(0, :k - 1) AS v"
+        ), {"uid": prop_uid, "k": size})
+        await db.execute(text(
+            "INSERT INTO product_properties (id, product_uid, property_uid, value_uid) "
+            "SELECT :base + g, 'p' || lpad(g::text, 8, '0'), :uid, CAST(:uid AS varchar) || '-' || floor(random() * :k)::int "
+            "FROM generate_series(1, :n) AS g"
+        ), {"base": index * products, "uid": prop_uid, "k": size, "n": products})
+
+    await db.execute(text("INSERT INTO properties (uid, name, type) VALUES ('int-price', 'int-price', 'int')"))
+    await db.execute(text(
+        "INSERT INTO product_properties (id, product_uid, property_uid, value_int) "
+        "SELECT :base + g, 'p' || lpad(g::text, 8, '0'), 'int-price', floor(random() * :max)::int "
+        "FROM generate_series(1, :n) AS g"
+    ), {"base": len(LIST_SIZES) * products, "max": INT_MAX, "n": products})
+
+    await counters.rebuild(db)
+    for table in TABLES:
+        await db.execute(text(f"ANALYZE {table}"))
+    await db.commit()
+
+
+def make_filters(values_per_property: int) -> dict:
+    # least selective first, the order a query string might list them in
+    filters = {
+        f"list-{size}": [f"list-{size}-{v}" for v in range(min(values_per_property, size - 1))]
+        for size in LIST_SIZES
+    }
+    filters["int-price"] = {"from": 0, "to": INT_MAX // 2}
+    return filters
+
+
+def legacy_filters(query, filters: dict):
+    """Прежняя схема: одно Product.uid IN (подзапрос) на каждое свойство в порядке запроса."""
+    pp = models.ProductProperty
+    for prop_uid, values in filters.items():
+        query = query.where(models.Product.uid.in_(
+            select(pp.product_uid).where(property_condition(prop_uid, values))))
+    return query
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+async def explain(db: AsyncSession, statement) -> dict:
+    result = await db.execute(text("EXPLAIN (ANALYZE, FORMAT JSON) " + compile_sql(statement)))
+    return result.scalar()[0]
+
+
+def walk(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from walk(child)
+
+
+def leftmost_leaf(plan: dict) -> dict:
+    while plan.get("Plans"):
+        plan = plan["Plans"][0]
+    return plan
+
+
+def check_plan(strategy: str, plan: dict, filters: dict) -> list:
+    """Вернуть список нарушений ожидаемой формы плана."""
+    problems = []
+    nodes = list(walk(plan["Plan"]))
+    node_types = [node["Node Type"] for node in nodes]
+
+    if strategy == "intersect":
+        setops = node_types.count("SetOp")
+        if setops != len(filters) - 1:
+            problems.append(f"expected {len(filters) - 1} SetOp nodes, got {setops}")
+        first_prop, _ = plan_filters(filters)[0]
+        leaf = leftmost_leaf(next(node for node in nodes if node["Node Type"] == "SetOp"))
+        conditions = " ".join(str(leaf.get(key, "")) for key in ("Index Cond", "Recheck Cond", "Filter"))
+        if first_prop not in conditions:
+            problems.append(f"first scanned input is not the most selective property {first_prop}: {conditions}")
+    elif strategy == "having":
+        # the driver set is the most selective condition
+        first_prop, _ = plan_filters(filters)[0]
+        if not any(first_prop in str(node.get("Index Cond", "")) for node in nodes):
+            problems.append(f"most selective property {first_prop} is not an index condition")
+        having = [node for node in nodes if node["Node Type"] == "Aggregate" and "count(DISTINCT" in node.get("Filter", "")]
+        if not having:
+            problems.append("no aggregate with HAVING count(DISTINCT property_uid)")
+
+    # the filter set must stay a single subquery, not one semi-join per property
+    semi_joins = sum(1 for node in nodes if node.get("Join Type") == "Semi" or node.get("Parent Relationship") == "SubPlan")
+    if semi_joins > 1:
+        problems.append(f"{semi_joins} semi-joins/subplans, expected one filtered set")
+    return problems
+
+
+def check_name_seek(plan: dict) -> list:
+    """Страница по имени должна читаться одним диапазоном индекса (name, uid)."""
+    problems = []
+    nodes = list(walk(plan["Plan"]))
+    # the copy in the bench schema has a generated name, products_name_uid_idx
+    scans = [node for node in nodes if "name_uid" in node.get("Index Name", "") and "Index Cond" in node]
+    if not scans:
+        problems.append("no index condition on the (name, uid) index")
+    for node_type in ("BitmapOr", "Sort"):
+        if any(node["Node Type"] == node_type for node in nodes):
+            problems.append(f"{node_type} in the plan")
+    return problems
+
+
+def check_range_update(plan: dict) -> list:
+    """min и max int свойства должны читаться с краев индекса, без Filter и агрегата по строкам."""
+    problems = []
+    nodes = list(walk(plan["Plan"]))
+    scans = [node for node in nodes if node.get("Relation Name") == "product_properties"]
+    if len(scans) != 2:
+        problems.append(f"expected 2 scans of product_properties, got {len(scans)}")
+    for node in scans:
+        if not node["Node Type"].startswith("Index") or "value_int" not in node.get("Index Name", ""):
+            problems.append(f"{node['Node Type']} {node.get('Index Name', '')} instead of the value_int index")
+        if "Filter" in node:
+            problems.append(f"filter {node['Filter']} checked per row")
+        if node["Actual Rows"] > 1:
+            problems.append(f"{node['Actual Rows']} rows read for one end of the range")
+    return problems
+
+
+async def main(args):
+    engine = create_async_engine(
+        settings.get_database_url(), connect_args={"server_settings": {"search_path": SCHEMA}})
+    session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    failed = False
+    async with session() as db:
+        await prepare(db, args.products)
+        await filter_stats.load(db)
+
+        filters = make_filters(args.values)
+        if args.properties:
+            filters = dict(sorted(filters.items(), key=lambda item: -filter_stats.estimate(*item))[:args.properties])
+        print("planned order:", ", ".join(
+            f"{prop_uid} (~{filter_stats.estimate(prop_uid, values):.0f})"
+            for prop_uid, values in plan_filters(filters)))
+
+        count_query = select(models.Product.uid)
+        cases = [("legacy", legacy_filters(count_query, filters))]
+        for strategy in ("intersect", "having", "auto"):
+            cases.append((strategy, count_query.where(models.Product.uid.in_(compile_filters(filters, strategy)))))
+
+        results = []
+        expected_rows = None
+        for label, query in cases:
+            plan = await explain(db, query)
+            rows = plan["Plan"]["Actual Rows"]
+            expected_rows = rows if expected_rows is None else expected_rows
+            strategy = choose_strategy(plan_filters(filters)) if label == "auto" else label
+            problems = [] if label == "legacy" else check_plan(strategy, plan, filters)
+            if rows != expected_rows:
+                problems.append(f"{rows} rows, legacy returned {expected_rows}")
+            failed = failed or bool(problems)
+            results.append({
+                "plan": label if strategy == label else f"{label} -> {strategy}",
+                "rows": rows,
+                "planning_ms": round(plan["Planning Time"], 3),
+                "execution_ms": round(plan["Execution Time"], 3),
+                "check": "; ".join(problems) or "ok",
+            })
+
+        # facets go through the same planner via apply_product_filters
+        facet_plan = await explain(db, facets.build_facet_query(filters=filters))
+        results.append({
+            "plan": f"facets ({settings.FILTER_PLAN})",
+            "rows": facet_plan["Plan"]["Actual Rows"],
+            "planning_ms": round(facet_plan["Planning Time"], 3),
+            "execution_ms": round(facet_plan["Execution Time"], 3),
+            "check": "ok",
+        })
+
+        # keyset pages by name: one range of ix_products_name_uid each, no BitmapOr or Sort
+        middle = (await db.execute(
+            select(models.Product.name, models.Product.uid).order_by(models.Product.name, models.Product.uid)
+            .offset(args.products // 2).limit(1))).first()
+        for label, after in (("name seek", tuple(middle)), ("name seek (NULL tail)", (None, ""))):
+            plan = await explain(db, select(models.Product.uid).where(crud.seek_condition("name", after))
+                                 .order_by(models.Product.name, models.Product.uid).limit(20))
+            problems = check_name_seek(plan)
+            failed = failed or bool(problems)
+            results.append({
+                "plan": label,
+                "rows": plan["Plan"]["Actual Rows"],
+                "planning_ms": round(plan["Planning Time"], 3),
+                "execution_ms": round(plan["Execution Time"], 3),
+                "check": "; ".join(problems) or "ok",
+            })
+
+        # what apply_deltas runs when a delete may shrink an int range
+        plan = await explain(db, counters.build_range_update(["int-price"]))
+        problems = check_range_update(plan)
+        failed = failed or bool(problems)
+        results.append({
+            "plan": "int range recompute",
+            "rows": plan["Plan"].get("Actual Rows", 0),
+            "planning_ms": round(plan["Planning Time"], 3),
+            "execution_ms": round(plan["Execution Time"], 3),
+            "check": "; ".join(problems) or "ok",
+        })
+
+        if args.show_sql:
+            print(compile_sql(apply_product_filters(count_query, filters=filters)))
+
+    await engine.dispose()
+
+    print(f"products: {args.products}, filters: {len(filters)}")
+    print_table(results, ["plan", "rows", "planning_ms", "execution_ms", "check"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--values", type=int, default=1, help="selected values per list property")
+    parser.add_argument("--properties", type=int, default=None,
+                        help="use only the N least selective filters (auto should switch to intersect)")
+    parser.add_argument("--show-sql", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
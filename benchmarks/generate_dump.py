@@ -0,0 +1,94 @@
+"""Генератор синтетического дампа каталога в формате test-dump.json.
+
+Значения list свойств выбираются по закону Ципфа (--skew, 0 - равномерно),
+int свойства - логнормально, поэтому популярные значения и узкие фильтры
+встречаются как в живом каталоге. Товары пишутся в файл потоково, так что
+можно генерировать миллионы строк. Одинаковый --seed дает одинаковый дамп.
+
+    python benchmarks/generate_dump.py dump.json --products 1000000 --properties 20 --values 50
+"""
+import argparse
+import itertools
+import json
+import random
+import uuid
+
+WORDS = [
+    "Смартфон", "Ноутбук", "Планшет", "Наушники", "Телевизор",
+    "Холодильник", "Пылесос", "Монитор", "Клавиатура", "Кофемашина",
+]
+
+
+def make_uid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def make_properties(rng: random.Random, properties: int, int_properties: int, values: int) -> list:
+    result = []
+    for p in range(1, properties + 1):
+        result.append({
+            "uid": make_uid(rng),
+            "name": f"Свойство list {p}",
+            "type": "list",
+            "values": [{"uid": make_uid(rng), "value": f"Значение {p}-{v}"} for v in range(1, values + 1)],
+        })
+    for p in range(1, int_properties + 1):
+        result.append({"uid": make_uid(rng), "name": f"Свойство int {p}", "type": "int", "value": p * 10})
+    return result
+
+
+def generate(path: str, products: int = 10000, properties: int = 10, int_properties: int = 3,
+             values: int = 20, skew: float = 1.1, fill: float = 0.8, seed: int = 42) -> dict:
+    """Записать дамп в path и вернуть его параметры."""
+    rng = random.Random(seed)
+    props = make_properties(rng, properties, int_properties, values)
+
+    # cumulative zipf weights: value i is picked with probability ~ 1 / (i + 1) ** skew
+    cum_weights = list(itertools.accumulate(1 / (i + 1) ** skew for i in range(values)))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"properties": ')
+        json.dump(props, f, ensure_ascii=False)
+        f.write(', "products": [\n')
+
+        for i in range(products):
+            product_props = []
+            for prop in props:
+                if rng.random() > fill:
+                    continue
+                if prop["type"] == "list":
+                    value = rng.choices(prop["values"], cum_weights=cum_weights)[0]
+                    product_props.append({"uid": prop["uid"], "value_uid": value["uid"], "value": value["value"]})
+                else:
+                    product_props.append({"uid": prop["uid"], "value": int(rng.lognormvariate(4, 1))})
+
+            if i:
+                f.write(",\n")
+            json.dump({
+                "uid": make_uid(rng),
+                "name": f"{WORDS[rng.randrange(len(WORDS))]} {rng.getrandbits(32):08x}",
+                "properties": product_props,
+            }, f, ensure_ascii=False)
+
+        f.write("\n]}\n")
+
+    return {
+        "products": products, "properties": properties, "int_properties": int_properties,
+        "values": values, "skew": skew, "fill": fill, "seed": seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--properties", type=int, default=10, help="list properties")
+    parser.add_argument("--int-properties", type=int, default=3)
+    parser.add_argument("--values", type=int, default=20, help="values per list property")
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent, 0 for uniform")
+    parser.add_argument("--fill", type=float, default=0.8, help="probability that a product has a property")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(generate(
+        args.path, args.products, args.properties, args.int_properties,
+        args.values, args.skew, args.fill, args.seed)))
@@ -0,0 +1,96 @@
+"""Страница каталога: проекция с json_agg в базе против ORM объектов с selectinload.
+
+Каталог генерируется и загружается так же, как в suite.py (база --database,
+--skip-load оставляет уже загруженный). Для каждого режима CATALOG_LISTING и
+размера страницы меряется время crud.get_products (count=none) вместе со
+сборкой ответа product_to_dict, по случайным страницам, каждая в новой сессии,
+как в запросе. Память - пик tracemalloc на одну страницу, отдельным проходом.
+
+    python benchmarks/listing.py --size 100000 --page-sizes 20 100
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+from common import measure, print_table, summarize
+from generate_dump import generate
+from suite import create_database, create_schema, load
+
+from core.config import settings  # noqa: E402
+
+MODES = ("orm", "projection")
+
+
+async def main(args):
+    settings.DB_NAME = args.database
+    await create_database(args.database)
+
+    from db.db import async_session, engine
+    from responses import product_to_dict
+    from service import crud
+    from service.registry import property_registry
+
+    if not args.skip_load:
+        await create_schema(engine)
+        data_dir = Path(args.data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        dump = data_dir / f"dump-{args.size}-10-3-20-1.1.json"
+        if not dump.exists():
+            generate(str(dump), products=args.size)
+        await load(engine, dump)
+
+    async with async_session() as db:
+        await property_registry.load(db)
+        total = (await crud.get_products(db, limit=1))[1]
+
+    rows = []
+    for page_size in args.page_sizes:
+        rng = random.Random(page_size)
+        offsets = [rng.randrange(max(1, total - page_size)) for _ in range(args.repeat + 3)]
+
+        for mode in MODES:
+            settings.CATALOG_LISTING = mode
+            pages = iter(offsets * 2)
+
+            async def fetch_page():
+                async with async_session() as db:
+                    products, _ = await crud.get_products(db, skip=next(pages), limit=page_size, count="none")
+                    return [product_to_dict(product) for product in products]
+
+            samples = await measure(fetch_page, repeat=args.repeat)
+
+            peaks = []
+            for _ in range(args.memory_pages):
+                tracemalloc.start()
+                await fetch_page()
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+            rows.append({
+                "page_size": page_size, "mode": mode, **summarize(samples),
+                "peak_kb": round(max(peaks) / 1024, 1),
+            })
+
+    await engine.dispose()
+
+    print_table(rows, ["page_size", "mode", "p50_ms", "p95_ms", "mean_ms", "peak_kb"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"size": total, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--memory-pages", type=int, default=5, help="pages traced for peak memory")
+    parser.add_argument("--database", default=f"{settings.DB_NAME}_bench")
+    parser.add_argument("--data-dir", default=str(Path(__file__).parent / ".data"))
+    parser.add_argument("--skip-load", action="store_true", help="use the catalog already in --database")
+    parser.add_argument("--json", help="write the results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
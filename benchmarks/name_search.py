@@ -0,0 +1,100 @@
+"""Сравнение поиска по имени: ILIKE без индекса, ILIKE по триграммному GIN и similarity.
+
+Создает в базе из .env отдельную таблицу bench_name_search на --products строк,
+поэтому рабочие таблицы каталога не затрагиваются. Нужен pg_trgm.
+
+    python benchmarks/name_search.py --products 1000000
+"""
+import argparse
+import asyncio
+import json
+
+import asyncpg
+
+from common import get_dsn, measure, print_table, summarize
+
+TABLE = "bench_name_search"
+WORDS = [
+    "Смартфон", "Ноутбук", "Планшет", "Наушники", "Телевизор",
+    "Холодильник", "Пылесос", "Монитор", "Клавиатура", "Кофемашина",
+]
+
+
+async def prepare(conn, products: int):
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    await conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (uid text PRIMARY KEY, name text)")
+
+    if await conn.fetchval(f"SELECT count(*) FROM {TABLE}") != products:
+        await conn.execute(f"TRUNCATE {TABLE}")
+        await conn.execute(
+            f"""
+            INSERT INTO {TABLE} (uid, name)
+            SELECT md5(g::text), ($2::text[])[1 + g % array_length($2::text[], 1)]
+                   || ' ' || substr(md5((g * 7)::text), 1, 10)
+            FROM generate_series(1, $1) AS g
+            """,
+            products, WORDS,
+        )
+    await conn.execute(f"DROP INDEX IF EXISTS ix_{TABLE}_name_trgm")
+    await conn.execute(f"ANALYZE {TABLE}")
+
+
+def ilike_case(conn, term: str):
+    # same shape as get_products: filtered count + first page ordered by uid
+    async def run():
+        await conn.fetchval(f"SELECT count(*) FROM {TABLE} WHERE name ILIKE $1", f"%{term}%")
+        await conn.fetch(f"SELECT uid, name FROM {TABLE} WHERE name ILIKE $1 ORDER BY uid LIMIT 10", f"%{term}%")
+    return run
+
+
+def similarity_case(conn, term: str, threshold: float):
+    async def run():
+        async with conn.transaction():
+            await conn.execute("SELECT set_config('pg_trgm.similarity_threshold', $1, true)", str(threshold))
+            await conn.fetchval(f"SELECT count(*) FROM {TABLE} WHERE name % $1", term)
+            await conn.fetch(
+                f"SELECT uid, name FROM {TABLE} WHERE name % $1 ORDER BY similarity(name, $1) DESC, uid LIMIT 10",
+                term)
+    return run
+
+
+async def main(args):
+    conn = await asyncpg.connect(get_dsn())
+    try:
+        await prepare(conn, args.products)
+
+        results = []
+        for term in args.terms:
+            samples = await measure(ilike_case(conn, term), repeat=args.repeat)
+            results.append({"mode": "ilike (seq scan)", "term": term, **summarize(samples)})
+
+        await conn.execute(f"CREATE INDEX ix_{TABLE}_name_trgm ON {TABLE} USING gin (name gin_trgm_ops)")
+        await conn.execute(f"ANALYZE {TABLE}")
+
+        for term in args.terms:
+            samples = await measure(ilike_case(conn, term), repeat=args.repeat)
+            results.append({"mode": "ilike (trgm gin)", "term": term, **summarize(samples)})
+            samples = await measure(similarity_case(conn, term, args.threshold), repeat=args.repeat)
+            results.append({"mode": f"similarity >= {args.threshold}", "term": term, **summarize(samples)})
+
+        if not args.keep:
+            await conn.execute(f"DROP TABLE {TABLE}")
+    finally:
+        await conn.close()
+
+    print(f"products: {args.products}, repeat: {args.repeat}")
+    print_table(results, ["mode", "term", "p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"products": args.products, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--terms", nargs="+", default=["ноутб", "3fa9c", "Смартфн"])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the bench table")
+    asyncio.run(main(parser.parse_args()))
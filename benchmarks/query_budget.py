@@ -0,0 +1,172 @@
+"""Проверка бюджета SQL запросов на эндпоинт на нескольких размерах каталога.
+
+Каталоги генерируются и загружаются так же, как в suite.py (база --database),
+приложение запускается с QUERY_COUNT_HEADER и без кэшей ответов, число
+запросов берется из заголовка X-Query-Count; измерения начинаются после
+подключения шины инвалидации. Для каждого эндпоинта максимум по
+набору запросов должен укладываться в BUDGETS и не расти с размером каталога:
+рост означает N+1. Код выхода 1, если проверка не прошла.
+
+    python benchmarks/query_budget.py --sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from pathlib import Path
+
+from common import print_table
+from generate_dump import generate
+from suite import create_database, create_schema, load
+
+from core.config import settings  # noqa: E402
+
+# max SQL statements per request, after the registry and planner stats are warm
+# and the invalidation bus holds the catalog version
+BUDGETS = {
+    "GET /catalog/": 2,
+    "GET /catalog/filter/": 1,
+    "GET /catalog/search/": 2,
+    "GET /product/{uid}": 2,
+    "POST /product/": 7,  # including pg_notify of the invalidation bus
+}
+
+
+async def requests_for(rng: random.Random, sample: int) -> dict:
+    """Набор запросов на эндпоинт: без фильтров, по одному и нескольким свойствам, диапазон, курсор."""
+    from sqlalchemy import text
+    from db.db import async_session
+    from service.registry import property_registry
+
+    async with async_session() as db:
+        await property_registry.load(db)
+        uids = (await db.execute(text("SELECT uid FROM products ORDER BY uid LIMIT 1000"))).scalars().all()
+
+    list_props = [p for p in property_registry.all() if p.type == "list" and p.value_uids]
+    int_props = [p for p in property_registry.all() if p.type != "list"]
+    filters = [
+        [],
+        [(f"property_{list_props[0].uid}", list_props[0].value_uids[0])],
+        [(f"property_{p.uid}", p.value_uids[0]) for p in list_props[:3]],
+        [(f"property_{p.uid}", v) for p in list_props[:2] for v in p.value_uids[:3]],
+        [(f"property_{int_props[0].uid}_from", "10"), (f"property_{int_props[0].uid}_to", "100")],
+        [("name", "Смартфон")],
+    ]
+
+    created = []
+    for i in range(sample):
+        created.append({
+            "uid": f"budget-{rng.getrandbits(64):016x}",
+            "name": f"Бюджет {i}",
+            "properties": [{"uid": p.uid, "value_uid": rng.choice(p.value_uids)} for p in list_props]
+            + [{"uid": p.uid, "value": rng.randrange(1000)} for p in int_props],
+        })
+
+    return {
+        "GET /catalog/": [("GET", "/catalog/", params + [("page_size", "50")]) for params in filters]
+        + [("GET", "/catalog/", [("cursor", ""), ("sort", "name"), ("page_size", "50")])],
+        "GET /catalog/filter/": [("GET", "/catalog/filter/", params) for params in filters],
+        "GET /catalog/search/": [("GET", "/catalog/search/", params + [("page_size", "50")]) for params in filters],
+        "GET /product/{uid}": [("GET", f"/product/{rng.choice(uids)}", []) for _ in range(sample)],
+        "POST /product/": [("POST", "/product/", body) for body in created],
+    }
+
+
+async def wait_for_bus(timeout: float = 10):
+    """Дождаться LISTEN соединения шины инвалидации.
+
+    Пока его нет, условные GET читают версию каталога из базы на каждый запрос,
+    и этот запрос попал бы в счетчик эндпоинта.
+    """
+    from service.events import invalidation_bus
+
+    if not settings.INVALIDATION_BUS:
+        return
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not invalidation_bus.connected:
+        if asyncio.get_running_loop().time() > deadline:
+            raise RuntimeError(f"invalidation bus did not connect in {timeout} s")
+        await asyncio.sleep(0.05)
+
+
+async def count_queries(client, method: str, url: str, payload) -> int:
+    if method == "POST":
+        response = await client.post(url, json=payload)
+    else:
+        response = await client.get(url, params=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"{method} {url}: {response.status_code} {response.text[:200]}")
+    return int(response.headers["x-query-count"])
+
+
+async def main(args):
+    settings.DB_NAME = args.database
+    settings.QUERY_COUNT_HEADER = True
+    settings.PRODUCT_CACHE_SIZE = 0
+    settings.FACET_CACHE_SIZE = 0
+    await create_database(args.database)
+
+    import httpx
+    from db.db import engine
+    from app.main import app
+
+    await create_schema(engine)
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    counts = {}  # endpoint -> {size: max count}
+    for size in args.sizes:
+        dump = data_dir / f"dump-{size}-10-3-20-1.1.json"
+        if not dump.exists():
+            generate(str(dump), products=size)
+        await load(engine, dump)
+
+        calls = await requests_for(random.Random(size), args.sample)
+        async with app.router.lifespan_context(app):
+            await wait_for_bus()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://budget") as client:
+                for endpoint, endpoint_calls in calls.items():
+                    # a warm-up pass loads the property registry and planner statistics;
+                    # creates cannot be repeated, so only the first one warms up
+                    warmup = endpoint_calls[:1] if endpoint.startswith("POST") else endpoint_calls
+                    for call in warmup:
+                        await count_queries(client, *call)
+                    measured = endpoint_calls[1:] if endpoint.startswith("POST") else endpoint_calls
+                    counts.setdefault(endpoint, {})[size] = max(
+                        [await count_queries(client, *call) for call in measured] or [0])
+
+    await engine.dispose()
+
+    rows = []
+    failed = False
+    for endpoint, by_size in counts.items():
+        smallest = by_size[args.sizes[0]]
+        problems = []
+        if max(by_size.values()) > BUDGETS[endpoint]:
+            problems.append(f"over budget {BUDGETS[endpoint]}")
+        if any(count > smallest for count in by_size.values()):
+            problems.append("grows with catalog size")
+        failed = failed or bool(problems)
+        rows.append({
+            "endpoint": endpoint, "budget": BUDGETS[endpoint],
+            **{str(size): count for size, count in by_size.items()},
+            "check": "; ".join(problems) or "ok",
+        })
+
+    print_table(rows, ["endpoint", "budget", *map(str, args.sizes), "check"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--sample", type=int, default=10, help="product reads and creates per size")
+    parser.add_argument("--database", default=f"{settings.DB_NAME}_bench")
+    parser.add_argument("--data-dir", default=str(Path(__file__).parent / ".data"))
+    parser.add_argument("--json", help="write the results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
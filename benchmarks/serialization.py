@@ -0,0 +1,84 @@
+"""Микро-бенчмарк сериализации страниц каталога: response_model против FastJSONResponse.
+
+База не нужна, страница собирается из синтетических объектов той же формы,
+что и ORM модели.
+
+    python benchmarks/serialization.py --page-size 100 --properties 10
+"""
+import argparse
+import asyncio
+import json
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from common import measure, print_table, summarize
+
+import responses  # noqa: E402
+import schemas  # noqa: E402
+from service.registry import PropertyInfo, property_registry  # noqa: E402
+
+
+def make_page(page_size: int, properties: int, values: int) -> dict:
+    props = []
+    for p in range(properties):
+        if p % 2:
+            props.append(PropertyInfo(
+                uid=f"prop-{p}", name=f"Свойство int {p}", type="int", values=p * 10, value_uids=()))
+        else:
+            props.append(PropertyInfo(
+                uid=f"prop-{p}", name=f"Свойство list {p}", type="list",
+                values=[{"value": f"Значение {p}-{v}"} for v in range(values)],
+                value_uids=tuple(f"value-{p}-{v}" for v in range(values))))
+    property_registry.replace(props)
+
+    products = []
+    for i in range(page_size):
+        products.append(SimpleNamespace(
+            uid=f"product-{i:06d}",
+            name=f"Товар {i}",
+            properties=[SimpleNamespace(property_uid=prop.uid) for prop in props],
+        ))
+
+    return {"products": [responses.product_to_dict(p) for p in products], "count": 100000}
+
+
+async def main(args):
+    content = make_page(args.page_size, args.properties, args.values)
+    field = create_model_field("Response_get_catalog", schemas.ProductListResponse, mode="serialization")
+
+    async def validated():
+        value = await serialize_response(field=field, response_content=content, exclude_unset=True)
+        return JSONResponse(value).body
+
+    async def fast():
+        return responses.FastJSONResponse(content).body
+
+    validated_body, fast_body = await validated(), await fast()
+    assert validated_body == fast_body, "fast path output differs"
+
+    results = []
+    for label, fn in (("response_model", validated), ("fast path", fast)):
+        samples = await measure(fn, repeat=args.repeat, warmup=10)
+        results.append({"path": label, "bytes": len(fast_body), **summarize(samples)})
+
+    speedup = results[0]["mean_ms"] / results[1]["mean_ms"] if results[1]["mean_ms"] else float("inf")
+    print(f"page_size: {args.page_size}, properties: {args.properties}, "
+          f"encoder: {'orjson' if responses.orjson else 'json'}")
+    print_table(results, ["path", "bytes", "p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    print(f"speedup: {speedup:.1f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "speedup": speedup}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--properties", type=int, default=10)
+    parser.add_argument("--values", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", help="write results to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,236 @@
+"""Бенчмарк эндпоинтов каталога и загрузчика на синтетических каталогах разного размера.
+
+Для каждого размера из --sizes генерируется дамп (generate_dump.py, кэшируется
+в --data-dir), загружается через importer в отдельную базу --database (по
+умолчанию <DB_NAME>_bench, создается при необходимости), затем приложение
+вызывается в процессе через httpx.ASGITransport. Для /catalog/, /catalog/filter/,
+/catalog/search/ и /product/{uid} меряются p50/p95/p99 последовательных запросов
+и пропускная способность при --concurrency параллельных клиентах (для
+загрузчика rps - строк в секунду). Кэши ответов по умолчанию выключены, чтобы
+мерить сами запросы (--with-caches включает).
+
+    python benchmarks/suite.py --sizes 1000 10000 100000 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+
+from common import get_dsn, print_table, summarize
+from generate_dump import generate
+
+from core.config import settings  # noqa: E402
+
+# app.main imports routers as app.view.*
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+WORKLOAD_SEED = 7
+
+
+async def create_database(name: str):
+    conn = await asyncpg.connect(get_dsn().rsplit("/", 1)[0] + "/postgres")
+    try:
+        if not await conn.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name):
+            await conn.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await conn.close()
+
+
+async def create_schema(engine):
+    from sqlalchemy import text
+    from tables import Base, models
+
+    async with engine.begin() as conn:
+        trgm = await conn.scalar(text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+        if trgm:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        else:
+            # the trigram index cannot be created without the extension
+            models.Product.__table__.indexes.discard(
+                next(i for i in models.Product.__table__.indexes if i.name == "ix_products_name_trgm"))
+            print("pg_trgm is not available, products.name trigram index skipped")
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def load(engine, dump: Path) -> dict:
+    from sqlalchemy import text
+    from db.db import async_session
+    from service import importer
+    from service.cache import catalog_generation, facet_cache, product_cache
+    from service.planner import filter_stats
+    from service.registry import property_registry
+    from tables import Base
+
+    async with engine.begin() as conn:
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        await conn.execute(text(f"TRUNCATE {tables} CASCADE"))
+    # in-process state of the previous dataset
+    property_registry.bump()
+    catalog_generation.bump()
+    product_cache.clear()
+    facet_cache.clear()
+    filter_stats.loaded_at = None
+
+    with open(dump, "rb") as f:
+        async with async_session() as db:
+            stats = await importer.import_catalog(db, importer.AsyncFile(f))
+
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+    return stats
+
+
+async def build_workload(requests: int) -> dict:
+    """Запросы к каждому эндпоинту: популярные и редкие значения, пары фильтров, диапазоны, имя."""
+    from sqlalchemy import text
+    from db.db import async_session
+    from service.registry import property_registry
+
+    rng = random.Random(WORKLOAD_SEED)
+    async with async_session() as db:
+        await property_registry.load(db)
+        uids = (await db.execute(text("SELECT uid FROM products ORDER BY uid LIMIT 5000"))).scalars().all()
+
+    list_props = [p for p in property_registry.all() if p.type == "list" and p.value_uids]
+    int_props = [p for p in property_registry.all() if p.type != "list"]
+
+    def list_filter():
+        prop = rng.choice(list_props)
+        # value_uids are in zipf rank order: mostly popular values, sometimes the long tail
+        index = min(int(rng.expovariate(0.5)), len(prop.value_uids) - 1)
+        return [(f"property_{prop.uid}", prop.value_uids[index])]
+
+    def params():
+        kind = rng.random()
+        if kind < 0.2:
+            return []
+        if kind < 0.5 or not int_props:
+            return list_filter()
+        if kind < 0.75:
+            return list_filter() + list_filter()
+        if kind < 0.9:
+            prop = rng.choice(int_props)
+            return [(f"property_{prop.uid}_from", "20"), (f"property_{prop.uid}_to", "150")]
+        return [("name", "Смартфон")]
+
+    return {
+        "/catalog/": [("/catalog/", params() + [("page_size", "20")]) for _ in range(requests)],
+        "/catalog/filter/": [("/catalog/filter/", params()) for _ in range(requests)],
+        "/catalog/search/": [("/catalog/search/", params() + [("page_size", "20")]) for _ in range(requests)],
+        "/product/{uid}": [(f"/product/{rng.choice(uids)}", []) for _ in range(requests)],
+    }
+
+
+async def run_endpoint(client, calls: list, concurrency: int) -> dict:
+    errors = 0
+    samples = []
+    for url, params in calls:
+        started = time.perf_counter()
+        response = await client.get(url, params=params)
+        samples.append(time.perf_counter() - started)
+        errors += response.status_code != 200
+
+    queue = list(calls)
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            url, params = queue.pop()
+            response = await client.get(url, params=params)
+            errors += response.status_code != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {**summarize(samples), "rps": round(len(calls) / elapsed, 1), "errors": errors}
+
+
+async def main(args):
+    settings.DB_NAME = args.database
+    if not args.with_caches:
+        settings.PRODUCT_CACHE_SIZE = 0
+        settings.FACET_CACHE_SIZE = 0
+    await create_database(args.database)
+
+    import httpx
+    from db.db import engine
+    from app.main import app
+
+    await create_schema(engine)
+    data_dir = Path(args.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            "database": args.database,
+            "catalog_backend": settings.CATALOG_BACKEND,
+            "filter_plan": settings.FILTER_PLAN,
+            "caches": args.with_caches,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": [],
+    }
+    rows = []
+
+    for size in args.sizes:
+        # every generator parameter is in the name, a cached dump is reused only for the same dataset
+        dump = data_dir / f"dump-{size}-{args.properties}-{args.int_properties}-{args.values}-{args.skew}.json"
+        dataset = {"products": size, "properties": args.properties, "int_properties": args.int_properties,
+                   "values": args.values, "skew": args.skew}
+        if not dump.exists():
+            generate(str(dump), products=size, properties=args.properties,
+                     int_properties=args.int_properties, values=args.values, skew=args.skew)
+
+        load_stats = await load(engine, dump)
+        rows.append({"size": size, "endpoint": "loader", "rps": load_stats["rows_per_second"],
+                     "mean_ms": round(load_stats["seconds"] * 1000, 1)})
+
+        workload = await build_workload(args.requests)
+        endpoints = {}
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, calls in workload.items():
+                    endpoints[name] = await run_endpoint(client, calls, args.concurrency)
+                    rows.append({"size": size, "endpoint": name, **endpoints[name]})
+
+        report["results"].append({
+            "dataset": dataset,
+            "dump_bytes": os.path.getsize(dump),
+            "load": load_stats,
+            "endpoints": endpoints,
+        })
+
+    await engine.dispose()
+
+    print_table(rows, ["size", "endpoint", "p50_ms", "p95_ms", "p99_ms", "mean_ms", "rps", "errors"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--database", default=f"{settings.DB_NAME}_bench")
+    parser.add_argument("--properties", type=int, default=10)
+    parser.add_argument("--int-properties", type=int, default=3)
+    parser.add_argument("--values", type=int, default=20)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--data-dir", default=str(Path(__file__).parent / ".data"))
+    parser.add_argument("--with-caches", action="store_true")
+    parser.add_argument("--json", help="write the report to this file")
+    asyncio.run(main(parser.parse_args()))